@@ -1,25 +1,207 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, current_app, g, has_request_context, request, jsonify, send_from_directory, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
-from flask_jwt_extended import JWTManager, create_access_token, get_jwt_identity, jwt_required
+from flask_sqlalchemy.session import Session as FlaskSession
+from flask_jwt_extended import JWTManager, create_access_token, get_jwt, get_jwt_identity, jwt_required
+from flask_jwt_extended.default_callbacks import default_decode_key_callback
 from flask_cors import CORS
+import click
+from sqlalchemy import and_, bindparam, column, create_engine, delete, event, func, inspect, insert, literal, literal_column, or_, select, table, text, union_all, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session, aliased, joinedload, selectinload
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.security import check_password_hash, generate_password_hash
+import base64
+import cProfile
+import csv
+import functools
+import gzip
+import hashlib
+import heapq
+import hmac
+import html
+import io
+import itertools
+import json
+import math
 import os
-from datetime import datetime
-#修改过的代码
-app = Flask(__name__)
+import queue
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-# 配置
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///dorm_repair.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['JWT_SECRET_KEY'] = 'your-secret-key-here-change-this-in-production'
-app.config['UPLOAD_FOLDER'] = 'uploads'
+try:
+    import brotli  # 可选依赖，安装后支持br压缩
+except ImportError:
+    brotli = None
+try:
+    import redis  # 可选依赖，多进程部署时用作限流计数存储
+except ImportError:
+    redis = None
+try:
+    import pyinstrument  # 可选依赖，安装后可用作请求剖析器
+except ImportError:
+    pyinstrument = None
+from datetime import datetime, timedelta
+from pathlib import Path
+# 配置：create_app()先载入这里的默认值，再用传入的配置覆盖
+class Config:
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///dorm_repair.db')
+    # 只读库：MySQL填从库地址；SQLite填sqlite-readonly，对同一数据库文件另开只读连接。配置后GET请求的查询走只读库
+    SQLALCHEMY_READ_URI = os.environ.get('SQLALCHEMY_READ_URI', '')
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))  # 等待空闲连接的秒数
+    # SQLite每个连接建立时执行的PRAGMA：WAL模式下读写互不阻塞，NORMAL同步在WAL下仍可保证一致性
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),  # 遇到写锁时等待的毫秒数
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -16000,  # 负数表示KB
+    }
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    JWT_SECRET_KEY = 'your-secret-key-here-change-this-in-production'
+    UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 单次上传上限16MB
+    IMAGE_MAX_SIZE = 1920  # 原图长边上限（像素）
+    IMAGE_THUMB_SIZE = 320  # 缩略图长边（像素）
+    IMAGE_QUALITY = 85
+    # 密码哈希参数，修改后旧哈希会在用户下次登录时自动升级
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    HASH_WORKERS = int(os.environ.get('HASH_WORKERS', os.cpu_count() or 2))  # 同时计算哈希的线程数
+    HASH_QUEUE_LIMIT = int(os.environ.get('HASH_QUEUE_LIMIT', 32))  # 允许排队的哈希任务数，超出返回503
+    # 限流：令牌桶，格式为“次数/周期”（周期可为second/minute/hour），即桶容量和补充速率
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', '1').lower() not in ('0', 'false')
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL', 'memory://')  # 多进程部署时改为 redis://host:6379/0
+    RATELIMIT_LOGIN_IP = os.environ.get('RATELIMIT_LOGIN_IP', '20/minute')
+    RATELIMIT_LOGIN_USER = os.environ.get('RATELIMIT_LOGIN_USER', '5/minute')
+    RATELIMIT_WRITE = os.environ.get('RATELIMIT_WRITE', '30/minute')
+    RATELIMIT_UPLOAD = os.environ.get('RATELIMIT_UPLOAD', '20/minute')
+    TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))  # 前置反向代理层数，用于识别客户端真实IP
+    FRONTEND_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'frontend')
+    # 部署在nginx/Apache之后时可设为true，由前端服务器通过X-Sendfile直接发送文件
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true')
+    # 自动派单：DISPATCH_INTERVAL为后台派单间隔秒数，0表示不在Web进程中运行（可改用 flask dispatch --loop 单独运行）
+    DISPATCH_INTERVAL = int(os.environ.get('DISPATCH_INTERVAL', 0))
+    DISPATCH_MAX_OPEN_TASKS = int(os.environ.get('DISPATCH_MAX_OPEN_TASKS', 5))  # 每名维修人员同时进行的任务上限
+    DISPATCH_HORIZON_HOURS = 24  # 预约时间在此范围之外的报修单暂不派单
+    DISPATCH_SLOT_MINUTES = 90  # 同一维修人员两个预约之间的最小间隔
+    DISPATCH_BATCH_SIZE = 5000  # 每轮最多处理的报修单数
+    # 归档：已完成/已拒绝超过ARCHIVE_AFTER_DAYS天的报修单移入归档表；ARCHIVE_INTERVAL为后台归档间隔秒数，0表示不在Web进程中运行
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 180))
+    ARCHIVE_INTERVAL = int(os.environ.get('ARCHIVE_INTERVAL', 0))
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 500))  # 每个事务移动的报修单数，控制单次持有写锁的时间
+    ARCHIVE_VACUUM_FREE_RATIO = 0.2  # SQLite空闲页占比超过该值时，归档后执行VACUUM整理数据库文件
+    # 重复报修识别：新报修单与同楼栋、同分类、最近DUPLICATE_WINDOW_HOURS小时内未关闭的报修单比较描述相似度，
+    # 达到阈值的合并到该报修单，之后审核、派单、完成都随主报修单一并处理。同一宿舍的报修使用较低的阈值
+    DUPLICATE_DETECTION = os.environ.get('DUPLICATE_DETECTION', '1').lower() not in ('0', 'false')
+    DUPLICATE_WINDOW_HOURS = 48
+    DUPLICATE_SIMILARITY = 0.5
+    DUPLICATE_SIMILARITY_SAME_ROOM = 0.3
+    DUPLICATE_MAX_CANDIDATES = 200
+    # 监控指标：按接口统计耗时、SQL次数与耗时、响应大小，以Prometheus文本格式在/metrics输出；
+    # 设置METRICS_TOKEN后抓取时需带 Authorization: Bearer <token>
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1').lower() not in ('0', 'false')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+    # 请求剖析：开启后带X-Profile请求头的请求会被剖析，耗时超过PROFILE_SLOW_MS的结果写入PROFILE_DIR。
+    # PROFILE_MODE可选sample（内置采样，输出折叠栈）、cprofile、pyinstrument（需安装）；设置PROFILE_TOKEN后请求头的值须与之相同
+    PROFILE_ENABLED = os.environ.get('PROFILE_ENABLED', '').lower() in ('1', 'true')
+    PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+    PROFILE_MODE = os.environ.get('PROFILE_MODE', 'sample')
+    PROFILE_SLOW_MS = int(os.environ.get('PROFILE_SLOW_MS', 200))
+    PROFILE_INTERVAL = 0.002  # 采样间隔（秒）
+    PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'profiles')
+
+# 数据库引擎：连接池大小按配置设置（内存SQLite使用单连接池，不设置）；MySQL定期回收连接并在取用前探活
+def build_engine_options(uri, config):
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return {}
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+    }
+    if url.get_backend_name() != 'sqlite':
+        options.update(pool_recycle=3600, pool_pre_ping=True)
+    return options
+
+# SQLite连接设置：建立连接时执行PRAGMA；由SQLAlchemy显式发出BEGIN，
+# 写请求（POST/PUT/DELETE）使用BEGIN IMMEDIATE在事务开始时就取得写锁，
+# 避免“先读后写”的事务在升级写锁时因其他事务已提交而直接报database is locked（不会等待busy_timeout）。
+# 要计算密码哈希的接口不能在持有写锁时计算（会让所有写请求排队），这些接口用普通BEGIN读取，
+# 在事务外算好哈希后调用begin_write_transaction()，以BEGIN IMMEDIATE开始一个短的写事务
+SQLITE_DEFERRED_ENDPOINTS = {'api.login', 'api.change_password', 'api.create_user', 'api.update_user', 'api.import_users'}
+
+def sqlite_begin_mode():
+    if has_request_context():
+        if g.pop('sqlite_begin_immediate', False):
+            return 'BEGIN IMMEDIATE'
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and request.endpoint not in SQLITE_DEFERRED_ENDPOINTS:
+            return 'BEGIN IMMEDIATE'
+    return 'BEGIN'
+
+def begin_write_transaction():
+    """结束当前事务，下一个事务作为写事务开始，之前加载的对象需要重新查询"""
+    db.session.rollback()
+    if has_request_context():
+        g.sqlite_begin_immediate = True
+
+def configure_sqlite_engine(engine, pragmas, readonly=False):
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None  # 关闭驱动自带的事务处理，由begin事件发出BEGIN
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            if readonly and name == 'journal_mode':
+                continue  # 只读连接不能修改日志模式，WAL设置保存在数据库文件中
+            cursor.execute('PRAGMA %s=%s' % (name, value))
+        cursor.close()
 
-# 创建上传文件夹
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    @event.listens_for(engine, 'begin')
+    def begin_sqlite_transaction(connection):
+        connection.exec_driver_sql('BEGIN' if readonly else sqlite_begin_mode())
 
-# 初始化扩展
-CORS(app)
-jwt = JWTManager(app)
-db = SQLAlchemy(app)
+# 读写分离：GET/HEAD请求中的查询交给只读引擎，写入和flush期间的查询仍走主库。只读引擎在首次使用时创建
+_read_engine_lock = threading.Lock()
+
+def get_read_engine():
+    read_uri = current_app.config['SQLALCHEMY_READ_URI']
+    if not read_uri:
+        return None
+    with _read_engine_lock:
+        engine = current_app.extensions.get('read_engine')
+        if engine is None:
+            if read_uri == 'sqlite-readonly':
+                read_uri = 'sqlite:///%s?mode=ro&uri=true' % Path(db.engine.url.database).resolve().as_uri()
+            engine = create_engine(read_uri, **build_engine_options(read_uri, current_app.config))
+            configure_sqlite_engine(engine, current_app.config['SQLITE_PRAGMAS'], readonly=True)
+            current_app.extensions['read_engine'] = engine
+        return engine
+
+class RoutingSession(FlaskSession):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and getattr(clause, 'is_select', False) \
+                and has_request_context() and request.method in ('GET', 'HEAD'):
+            read_engine = get_read_engine()
+            if read_engine is not None:
+                return read_engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+# 扩展在模块中创建，由create_app()绑定到应用；路由注册在蓝图上
+cors = CORS()
+jwt = JWTManager()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+bp = Blueprint('api', __name__, cli_group=None)
 
 # 数据库模型
 class User(db.Model):
@@ -51,15 +233,28 @@ class RepairOrder(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
     completed_at = db.Column(db.DateTime)
+    building = db.Column(db.String(50))  # 由宿舍信息解析出的楼栋，用于查找重复报修
+    parent_id = db.Column(db.Integer)  # 重复报修合并到的主报修单；不设外键，主报修单可能先于它被归档
     student = db.relationship('User', foreign_keys=[student_id], backref='student_orders')
     repairman = db.relationship('User', foreign_keys=[repairman_id], backref='repairman_orders')
     category = db.relationship('Category', backref='repair_orders')
+    # 与列表查询的筛选+排序方式对应：按状态/学生/维修人员筛选后按创建时间倒序翻页
+    __table_args__ = (
+        db.Index('ix_repair_order_status_created_at', 'status', 'created_at'),
+        db.Index('ix_repair_order_student_created_at', 'student_id', 'created_at'),
+        db.Index('ix_repair_order_repairman_created_at', 'repairman_id', 'created_at'),
+        db.Index('ix_repair_order_created_at', 'created_at'),
+        db.Index('ix_repair_order_category_building_created_at', 'category_id', 'building', 'created_at'),
+        db.Index('ix_repair_order_parent_id', 'parent_id'),
+        {'sqlite_autoincrement': True},  # 归档会删除热表中的行，SQLite不带AUTOINCREMENT时新行会复用已删除的最大id
+    )
 
 class RepairImage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     repair_order_id = db.Column(db.Integer, db.ForeignKey('repair_order.id'), nullable=False)
     image_path = db.Column(db.String(200), nullable=False)
     repair_order = db.relationship('RepairOrder', backref='images')
+    __table_args__ = (db.Index('ix_repair_image_repair_order_id', 'repair_order_id'), {'sqlite_autoincrement': True})
 
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -70,6 +265,55 @@ class Comment(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.now)
     repair_order = db.relationship('RepairOrder', backref='comment')
     student = db.relationship('User', backref='comments')
+    __table_args__ = (db.Index('ix_comment_repair_order_id', 'repair_order_id'), {'sqlite_autoincrement': True})
+
+# 归档表：字段与热表相同（报修单多一个归档时间），关闭已久的报修单连同图片、评价移到这里，
+# 详情、检索、评价等按id查询的接口在热表找不到时再查归档表
+class ArchivedRepairOrder(db.Model):
+    __tablename__ = 'repair_order_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    repairman_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
+    room = db.Column(db.String(50), nullable=False)
+    description = db.Column(db.Text, nullable=False)
+    appointment_time = db.Column(db.DateTime)
+    status = db.Column(db.String(20), nullable=False)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime)
+    building = db.Column(db.String(50))
+    parent_id = db.Column(db.Integer)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    student = db.relationship('User', foreign_keys=[student_id])
+    repairman = db.relationship('User', foreign_keys=[repairman_id])
+    category = db.relationship('Category')
+    images = db.relationship('ArchivedRepairImage')
+    comment = db.relationship('ArchivedComment')
+    __table_args__ = (
+        db.Index('ix_repair_order_archive_student_created_at', 'student_id', 'created_at'),
+        db.Index('ix_repair_order_archive_repairman_created_at', 'repairman_id', 'created_at'),
+        db.Index('ix_repair_order_archive_created_at', 'created_at'),
+        db.Index('ix_repair_order_archive_parent_id', 'parent_id'),
+    )
+
+class ArchivedRepairImage(db.Model):
+    __tablename__ = 'repair_image_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    repair_order_id = db.Column(db.Integer, db.ForeignKey('repair_order_archive.id'), nullable=False)
+    image_path = db.Column(db.String(200), nullable=False)
+    __table_args__ = (db.Index('ix_repair_image_archive_repair_order_id', 'repair_order_id'),)
+
+class ArchivedComment(db.Model):
+    __tablename__ = 'comment_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    repair_order_id = db.Column(db.Integer, db.ForeignKey('repair_order_archive.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    rating = db.Column(db.Integer, nullable=False)
+    content = db.Column(db.Text)
+    created_at = db.Column(db.DateTime)
+    student = db.relationship('User')
+    __table_args__ = (db.Index('ix_comment_archive_repair_order_id', 'repair_order_id'),)
 
 class Announcement(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -80,18 +324,897 @@ class Announcement(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
     author = db.relationship('User', backref='announcements')
 
-# 创建数据库表
-with app.app_context():
+# 统计汇总表：按天累加，状态变化时增量更新，看板查询不再扫描repair_order
+class DailyRepairStat(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
+    building = db.Column(db.String(50), nullable=False)
+    created_count = db.Column(db.Integer, nullable=False, default=0)
+    completed_count = db.Column(db.Integer, nullable=False, default=0)
+    complete_seconds = db.Column(db.BigInteger, nullable=False, default=0)  # 完成耗时累计（秒）
+    __table_args__ = (db.UniqueConstraint('day', 'category_id', 'building'),)
+
+class DailyRepairmanStat(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    repairman_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    completed_count = db.Column(db.Integer, nullable=False, default=0)
+    complete_seconds = db.Column(db.BigInteger, nullable=False, default=0)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (db.UniqueConstraint('day', 'repairman_id'),)
+
+# 报修单事件日志：每次状态变化和评价追加一行，只增不改，用于审计和客户端增量同步（id即同步游标）
+class OrderEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, nullable=False)
+    type = db.Column(db.String(20), nullable=False)  # created, approved, rejected, accepted, assigned, completed, commented
+    status = db.Column(db.String(20), nullable=False)  # 事件发生后的状态
+    student_id = db.Column(db.Integer, nullable=False)
+    repairman_id = db.Column(db.Integer)
+    actor_id = db.Column(db.Integer)  # 操作人，自动派单等系统操作为空
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    __table_args__ = (db.Index('ix_order_event_order_id', 'order_id', 'id'),)
+
+@event.listens_for(OrderEvent, 'before_update')
+@event.listens_for(OrderEvent, 'before_delete')
+def reject_order_event_change(mapper, connection, target):
+    raise ValueError('报修单事件日志不允许修改或删除')
+
+# 评分汇总：每名维修人员、每个故障分类一行，保存评分次数、总分、各星级数量和最近N次评分，
+# 提交评价时在同一事务中更新，排行榜和看板直接读取
+RATING_SCOPES = ('repairman', 'category')
+RATING_RECENT_SIZE = 20
+
+class RatingAggregate(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(20), nullable=False)  # repairman, category
+    subject_id = db.Column(db.Integer, nullable=False)  # 维修人员ID或分类ID
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    star_1 = db.Column(db.Integer, nullable=False, default=0)
+    star_2 = db.Column(db.Integer, nullable=False, default=0)
+    star_3 = db.Column(db.Integer, nullable=False, default=0)
+    star_4 = db.Column(db.Integer, nullable=False, default=0)
+    star_5 = db.Column(db.Integer, nullable=False, default=0)
+    recent = db.Column(db.Text, nullable=False, default='[]')  # 最近的评分（JSON数组，新的在前）
+    __table_args__ = (db.UniqueConstraint('scope', 'subject_id'),)
+
+def rating_summary(aggregate):
+    if aggregate is None:
+        return {'rating_count': 0, 'avg_rating': None, 'histogram': {str(star): 0 for star in range(1, 6)},
+                'recent_count': 0, 'recent_avg_rating': None}
+    recent = json.loads(aggregate.recent or '[]')
+    return {
+        'rating_count': aggregate.rating_count,
+        'avg_rating': round(aggregate.rating_sum / aggregate.rating_count, 2) if aggregate.rating_count else None,
+        'histogram': {str(star): getattr(aggregate, 'star_%d' % star) for star in range(1, 6)},
+        'recent_count': len(recent),
+        'recent_avg_rating': round(sum(recent) / len(recent), 2) if recent else None
+    }
+
+# 自动派单用的维修人员技能（可处理的故障分类）和负责楼栋；未设置技能的维修人员可处理所有分类
+class RepairmanSkill(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    repairman_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
+    __table_args__ = (db.UniqueConstraint('repairman_id', 'category_id'),)
+
+class RepairmanArea(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    repairman_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    building = db.Column(db.String(50), nullable=False)
+    __table_args__ = (db.UniqueConstraint('repairman_id', 'building'),)
+
+# 各业务表的数据版本号：同一事务内随写入递增，用于生成列表接口的ETag（多进程共享）
+class TableVersion(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+# 已执行的数据库迁移版本
+class SchemaMigration(db.Model):
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.now)
+
+VERSIONED_TABLES = ('user', 'category', 'repair_order', 'repair_image', 'comment', 'announcement',
+                    'repair_order_archive', 'repair_image_archive', 'comment_archive', 'order_event')
+
+def bump_table_versions(session, tables):
+    tables = sorted(set(tables) & set(VERSIONED_TABLES))
+    if tables:
+        table = TableVersion.__table__
+        session.connection().execute(update(table).where(table.c.name.in_(tables))
+                                     .values(version=table.c.version + 1))
+
+@event.listens_for(Session, 'after_flush')
+def bump_versions_after_flush(session, flush_context):
+    tables = {obj.__table__.name for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+              if hasattr(obj, '__table__')}
+    bump_table_versions(session, tables)
+
+# 批量insert/update/delete语句不经过flush，单独处理
+@event.listens_for(Session, 'do_orm_execute')
+def bump_versions_on_bulk_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None and table.name != TableVersion.__tablename__:
+            bump_table_versions(orm_execute_state.session, [table.name])
+
+# 故障分类：id -> 名称，读缓存
+def get_category_map():
+    return category_cache.get_or_load(versioned_cache_key('all', 'category'),
+                                      lambda: {c.id: c.name for c in Category.query.order_by(Category.id)})
+
+# 报修单查询：一对一关联用JOIN，一对多关联用SELECT IN批量加载，避免N+1查询。model可传ArchivedRepairOrder查询归档表
+def repair_order_query(model=RepairOrder):
+    return model.query.options(
+        joinedload(model.category),
+        joinedload(model.student),
+        joinedload(model.repairman),
+        selectinload(model.images)
+    )
+
+# 报修单列表筛选条件：status、category、room（楼栋/房间前缀）、date_from、date_to
+def apply_repair_filters(query, args, model=RepairOrder):
+    status = args.get('status')
+    if status:
+        query = query.filter(model.status.in_(status.split(',')))
+    category_id = args.get('category', type=int)
+    if category_id:
+        query = query.filter(model.category_id == category_id)
+    room = args.get('room')
+    if room:
+        room = room.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        query = query.filter(model.room.like(room + '%', escape='\\'))
+    try:
+        date_from = args.get('date_from')
+        if date_from:
+            query = query.filter(model.created_at >= datetime.strptime(date_from, '%Y-%m-%d'))
+        date_to = args.get('date_to')
+        if date_to:
+            query = query.filter(model.created_at < datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1))
+    except ValueError:
+        raise ValueError('日期格式应为YYYY-MM-DD')
+    return query
+
+# 图片按内容SHA-256寻址存储：images/ab/cd/<sha256>.jpg，缩略图在thumbs下同名
+IMAGE_PATH_RE = re.compile(r'^images/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+
+def thumb_path(image_path):
+    return 'thumbs/' + image_path[len('images/'):]
+
+def upload_url(path):
+    return '/uploads/' + path
+
+def is_stored_image(image_path):
+    return bool(image_path and IMAGE_PATH_RE.match(image_path)) and \
+        os.path.exists(os.path.join(current_app.config['UPLOAD_FOLDER'], image_path))
+
+def write_file_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+def encode_jpeg(image, max_size):
+    image = image.copy()
+    image.thumbnail((max_size, max_size))
+    output = io.BytesIO()
+    # 不传exif参数，重新编码后的文件不含任何EXIF信息（包括GPS位置）
+    image.save(output, 'JPEG', quality=current_app.config['IMAGE_QUALITY'], optimize=True)
+    return output.getvalue()
+
+# 保存上传图片：相同内容只存一份，重复上传直接复用已有文件
+def store_image(data):
+    from PIL import Image, ImageOps
+    
+    digest = hashlib.sha256(data).hexdigest()
+    image_path = 'images/%s/%s/%s.jpg' % (digest[:2], digest[2:4], digest)
+    full_path = os.path.join(current_app.config['UPLOAD_FOLDER'], image_path)
+    if os.path.exists(full_path):
+        return image_path
+    
+    image = Image.open(io.BytesIO(data))
+    image.verify()  # verify之后必须重新打开
+    image = Image.open(io.BytesIO(data))
+    image = ImageOps.exif_transpose(image)  # 按EXIF方向摆正后再丢弃EXIF
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    
+    write_file_atomic(os.path.join(current_app.config['UPLOAD_FOLDER'], thumb_path(image_path)),
+                      encode_jpeg(image, current_app.config['IMAGE_THUMB_SIZE']))
+    write_file_atomic(full_path, encode_jpeg(image, current_app.config['IMAGE_MAX_SIZE']))
+    return image_path
+
+# 游标编码：created_at + id，客户端原样回传即可
+def encode_cursor(order):
+    raw = '%s|%d' % (order.created_at.isoformat(), order.id)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        created_at, order_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(order_id)
+    except Exception:
+        raise ValueError('无效的分页游标')
+
+# 按(created_at, id)做键集分页，深翻页也只扫描一页的数据
+def paginate_repair_orders(query, args, default_limit=20, max_limit=100, model=RepairOrder):
+    limit = min(max(args.get('limit', default_limit, type=int), 1), max_limit)
+    descending = args.get('order', 'desc') != 'asc'
+    query = apply_repair_filters(query, args, model)
+
+    total = None
+    if args.get('with_total', '1') not in ('0', 'false'):
+        total = query.order_by(None).with_entities(func.count(model.id)).scalar()
+
+    cursor = args.get('cursor')
+    if cursor:
+        created_at, order_id = decode_cursor(cursor)
+        if descending:
+            query = query.filter(or_(model.created_at < created_at,
+                                     and_(model.created_at == created_at, model.id < order_id)))
+        else:
+            query = query.filter(or_(model.created_at > created_at,
+                                     and_(model.created_at == created_at, model.id > order_id)))
+
+    if descending:
+        query = query.order_by(model.created_at.desc(), model.id.desc())
+    else:
+        query = query.order_by(model.created_at.asc(), model.id.asc())
+
+    # 多取一条用于判断是否还有下一页
+    orders = query.limit(limit + 1).all()
+    has_more = len(orders) > limit
+    orders = orders[:limit]
+    page = {
+        'next_cursor': encode_cursor(orders[-1]) if has_more else None,
+        'has_more': has_more,
+        'total': total
+    }
+    return orders, page
+
+# 全文检索：SQLite使用FTS5虚拟表（trigram分词，适合不分词的中文），由触发器与报修单、学生姓名保持同步；
+# MySQL使用ngram分词的FULLTEXT索引。trigram只能索引不少于3个字的检索词，更短的词在索引表上做LIKE过滤
+repair_order_fts = table('repair_order_fts', column('rowid'), column('room'), column('description'), column('student_name'))
+
+SQLITE_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS repair_order_fts
+       USING fts5(room, description, student_name, tokenize='trigram')""",
+    """CREATE TRIGGER IF NOT EXISTS repair_order_fts_insert AFTER INSERT ON repair_order BEGIN
+         INSERT INTO repair_order_fts(rowid, room, description, student_name)
+         VALUES (new.id, new.room, new.description, (SELECT name FROM user WHERE id = new.student_id));
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS repair_order_fts_update AFTER UPDATE OF room, description, student_id ON repair_order BEGIN
+         DELETE FROM repair_order_fts WHERE rowid = old.id;
+         INSERT INTO repair_order_fts(rowid, room, description, student_name)
+         VALUES (new.id, new.room, new.description, (SELECT name FROM user WHERE id = new.student_id));
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS repair_order_fts_delete AFTER DELETE ON repair_order BEGIN
+         DELETE FROM repair_order_fts WHERE rowid = old.id;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS user_name_fts_update AFTER UPDATE OF name ON user BEGIN
+         UPDATE repair_order_fts SET student_name = new.name
+         WHERE rowid IN (SELECT id FROM repair_order WHERE student_id = new.id
+                         UNION ALL SELECT id FROM repair_order_archive WHERE student_id = new.id);
+       END""",
+]
+
+MYSQL_FULLTEXT_DDL = [
+    ('repair_order', 'ft_repair_order_text',
+     'ALTER TABLE repair_order ADD FULLTEXT INDEX ft_repair_order_text (room, description) WITH PARSER ngram'),
+    ('user', 'ft_user_name', 'ALTER TABLE user ADD FULLTEXT INDEX ft_user_name (name) WITH PARSER ngram'),
+    ('repair_order_archive', 'ft_repair_order_archive_text',
+     'ALTER TABLE repair_order_archive ADD FULLTEXT INDEX ft_repair_order_archive_text (room, description) WITH PARSER ngram'),
+]
+
+SEARCH_MIN_TERM = 3  # trigram索引可用的最短检索词
+SEARCH_MAX_TERMS = 8
+
+def setup_fulltext_search():
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        created = not db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE name = 'repair_order_fts'")).first()
+        for ddl in SQLITE_FTS_DDL:
+            db.session.execute(text(ddl))
+        if created:
+            # 首次建索引时导入已有报修单（含归档单）
+            db.session.execute(text(
+                """INSERT INTO repair_order_fts(rowid, room, description, student_name)
+                   SELECT o.id, o.room, o.description, u.name
+                   FROM repair_order o LEFT JOIN user u ON u.id = o.student_id
+                   UNION ALL
+                   SELECT o.id, o.room, o.description, u.name
+                   FROM repair_order_archive o LEFT JOIN user u ON u.id = o.student_id"""))
+        db.session.commit()
+    elif dialect == 'mysql':
+        for table_name, index_name, ddl in MYSQL_FULLTEXT_DDL:
+            exists = db.session.execute(text(
+                'SELECT 1 FROM information_schema.statistics WHERE table_schema = DATABASE() '
+                'AND table_name = :t AND index_name = :i'), {'t': table_name, 'i': index_name}).first()
+            if not exists:
+                db.session.execute(text(ddl))
+        db.session.commit()
+
+def parse_search_terms(q):
+    terms = []
+    for term in (q or '').replace('"', ' ').split():
+        if term not in terms:
+            terms.append(term)
+    return terms[:SEARCH_MAX_TERMS]
+
+def search_repair_orders(query, terms, model=RepairOrder):
+    """按检索词过滤并按相关度排序，所有词都需命中（在宿舍、描述、学生姓名任一字段中）"""
+    dialect = db.engine.dialect.name
+    if dialect == 'mysql':
+        # 每个词都需命中由LIKE条件保证（词可能分别落在两个索引上），MATCH负责走索引和计算相关度
+        expr = ' '.join('"%s"' % term for term in terms)
+        order_match = 'MATCH({0}.room, {0}.description) AGAINST (:q IN BOOLEAN MODE)'.format(model.__tablename__)
+        score = text('(%s + MATCH(student.name) AGAINST (:q IN BOOLEAN MODE))' % order_match).bindparams(q=expr)
+        student = aliased(User, name='student')
+        query = query.join(student, student.id == model.student_id)
+        for term in terms:
+            pattern = '%' + term + '%'
+            query = query.filter(or_(model.room.like(pattern), model.description.like(pattern),
+                                     student.name.like(pattern)))
+        return query.filter(text('(%s OR MATCH(student.name) AGAINST (:q IN BOOLEAN MODE))' % order_match)
+                            .bindparams(q=expr)) \
+                    .order_by(score.desc(), model.id.desc())
+    if dialect != 'sqlite':
+        raise ValueError('当前数据库不支持全文检索')
+
+    fts = repair_order_fts
+    long_terms = [t for t in terms if len(t) >= SEARCH_MIN_TERM]
+    if long_terms:
+        # bm25越小越相关，宿舍字段权重更高
+        rank = literal_column('bm25(repair_order_fts, 2.0, 1.0, 1.0)')
+    else:
+        rank = literal_column('0')
+    matches = select(fts.c.rowid.label('order_id'), rank.label('rank'))
+    if long_terms:
+        expr = ' AND '.join('"%s"' % term for term in long_terms)
+        matches = matches.where(literal_column('repair_order_fts').op('MATCH')(expr))
+    for term in terms:
+        if len(term) < SEARCH_MIN_TERM:
+            pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            matches = matches.where(or_(fts.c.room.like(pattern, escape='\\'),
+                                        fts.c.description.like(pattern, escape='\\'),
+                                        fts.c.student_name.like(pattern, escape='\\')))
+    matches = matches.subquery()
+    return query.join(matches, model.id == matches.c.order_id) \
+                .order_by(matches.c.rank, model.id.desc())
+
+def highlight_terms(value, terms):
+    """转义HTML后用<mark>标记命中的检索词"""
+    value = html.escape(value or '')
+    if not terms:
+        return value
+    pattern = re.compile('|'.join(re.escape(html.escape(t)) for t in sorted(terms, key=len, reverse=True)), re.I)
+    return pattern.sub(lambda m: '<mark>%s</mark>' % m.group(0), value)
+
+# 从宿舍信息中解析楼栋，如“3号楼301”->“3号楼”，“A3-301”->“A3”
+def parse_building(room):
+    room = (room or '').strip()
+    match = re.match(r'^(.*?(?:号楼|栋|幢|楼))', room) or re.match(r'^([A-Za-z]*\d+)', room)
+    return match.group(1).strip() if match else '其他'
+
+# 计数器增量更新：先UPDATE累加，行不存在时再INSERT（并发插入冲突时退回UPDATE）
+def bump_counters(model, keys, **increments):
+    values = {getattr(model, k): getattr(model, k) + v for k, v in increments.items()}
+    if model.query.filter_by(**keys).update(values, synchronize_session=False):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(model(**keys, **increments))
+    except IntegrityError:
+        model.query.filter_by(**keys).update(values, synchronize_session=False)
+
+def rollup_order_created(order):
+    bump_counters(DailyRepairStat,
+                  dict(day=order.created_at.date(), category_id=order.category_id, building=parse_building(order.room)),
+                  created_count=1)
+
+def rollup_order_completed(order):
+    seconds = max(int((order.completed_at - order.created_at).total_seconds()), 0)
+    day = order.completed_at.date()
+    bump_counters(DailyRepairStat,
+                  dict(day=day, category_id=order.category_id, building=parse_building(order.room)),
+                  completed_count=1, complete_seconds=seconds)
+    if order.repairman_id:
+        bump_counters(DailyRepairmanStat, dict(day=day, repairman_id=order.repairman_id),
+                      completed_count=1, complete_seconds=seconds)
+
+def rollup_comment(comment, order):
+    if order.repairman_id:
+        bump_counters(DailyRepairmanStat, dict(day=comment.created_at.date(), repairman_id=order.repairman_id),
+                      rating_count=1, rating_sum=comment.rating)
+    for scope, subject_id in (('repairman', order.repairman_id), ('category', order.category_id)):
+        if subject_id:
+            bump_counters(RatingAggregate, dict(scope=scope, subject_id=subject_id),
+                          rating_count=1, rating_sum=comment.rating, **{'star_%d' % comment.rating: 1})
+            # 最近N次评分需要读改写，先锁定该行（SQLite写请求已在事务开始时取得写锁）
+            aggregate = RatingAggregate.query.filter_by(scope=scope, subject_id=subject_id).with_for_update().one()
+            aggregate.recent = json.dumps([comment.rating] + json.loads(aggregate.recent or '[]')[:RATING_RECENT_SIZE - 1])
+
+def rebuild_rating_aggregates():
+    RatingAggregate.query.delete()
+    aggregates = {}
+    # 热表和归档表的评价合并后按时间倒序，最近N次评分才准确
+    rows = union_all(*(
+        select(comment_model.rating, order_model.repairman_id, order_model.category_id,
+               comment_model.created_at, comment_model.id).join(order_model, comment_model.repair_order_id == order_model.id)
+        for order_model, comment_model in ((RepairOrder, Comment), (ArchivedRepairOrder, ArchivedComment))
+    )).subquery()
+    rows = db.session.execute(select(rows.c.rating, rows.c.repairman_id, rows.c.category_id)
+                              .order_by(rows.c.created_at.desc(), rows.c.id.desc())
+                              .execution_options(yield_per=1000))
+    for rating, repairman_id, category_id in rows:
+        for key in (('repairman', repairman_id), ('category', category_id)):
+            if not key[1]:
+                continue
+            aggregate = aggregates.get(key)
+            if aggregate is None:
+                aggregate = aggregates[key] = RatingAggregate(scope=key[0], subject_id=key[1], rating_count=0,
+                                                              rating_sum=0, star_1=0, star_2=0, star_3=0,
+                                                              star_4=0, star_5=0, recent=[])
+            aggregate.rating_count += 1
+            aggregate.rating_sum += rating
+            setattr(aggregate, 'star_%d' % rating, getattr(aggregate, 'star_%d' % rating) + 1)
+            if len(aggregate.recent) < RATING_RECENT_SIZE:
+                aggregate.recent.append(rating)
+    for aggregate in aggregates.values():
+        aggregate.recent = json.dumps(aggregate.recent)
+    db.session.add_all(aggregates.values())
+    db.session.commit()
+
+# 根据明细重建统计汇总表（首次部署或数据修复时使用）
+def rebuild_daily_stats():
+    DailyRepairStat.query.delete()
+    DailyRepairmanStat.query.delete()
+    daily, repairman_daily = {}, {}
+    for order_model, comment_model in ((RepairOrder, Comment), (ArchivedRepairOrder, ArchivedComment)):
+        orders = db.session.query(order_model.created_at, order_model.completed_at, order_model.category_id,
+                                  order_model.room, order_model.repairman_id, order_model.status, order_model.parent_id)
+        for created_at, completed_at, category_id, room, repairman_id, status, parent_id in orders.yield_per(1000):
+            building = parse_building(room)
+            row = daily.setdefault((created_at.date(), category_id, building), [0, 0, 0])
+            row[0] += 1
+            if status == 'completed' and completed_at and parent_id is None:  # 重复报修随主报修单完成，不重复计数
+                seconds = max(int((completed_at - created_at).total_seconds()), 0)
+                row = daily.setdefault((completed_at.date(), category_id, building), [0, 0, 0])
+                row[1] += 1
+                row[2] += seconds
+                if repairman_id:
+                    row = repairman_daily.setdefault((completed_at.date(), repairman_id), [0, 0, 0, 0])
+                    row[0] += 1
+                    row[1] += seconds
+        comments = db.session.query(comment_model.created_at, comment_model.rating, order_model.repairman_id).join(
+            order_model, comment_model.repair_order_id == order_model.id).filter(order_model.repairman_id.isnot(None))
+        for created_at, rating, repairman_id in comments.yield_per(1000):
+            row = repairman_daily.setdefault((created_at.date(), repairman_id), [0, 0, 0, 0])
+            row[2] += 1
+            row[3] += rating
+    db.session.bulk_insert_mappings(DailyRepairStat, [
+        dict(day=k[0], category_id=k[1], building=k[2], created_count=v[0], completed_count=v[1], complete_seconds=v[2])
+        for k, v in daily.items()])
+    db.session.bulk_insert_mappings(DailyRepairmanStat, [
+        dict(day=k[0], repairman_id=k[1], completed_count=v[0], complete_seconds=v[1], rating_count=v[2], rating_sum=v[3])
+        for k, v in repairman_daily.items()])
+    db.session.commit()
+
+@bp.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """重建看板统计汇总表"""
+    rebuild_daily_stats()
+    print('统计汇总表重建完成')
+
+@bp.cli.command('rebuild-ratings')
+def rebuild_ratings_command():
+    """根据评价明细重建评分汇总表"""
+    rebuild_rating_aggregates()
+    print('评分汇总表重建完成，共%d行' % RatingAggregate.query.count())
+
+# 数据库迁移：db.create_all()只会建缺失的表，已有表的结构变化（索引、字段等）写成按版本号顺序执行的迁移函数，
+# 执行记录保存在schema_migration表中。迁移函数须可重复执行（新库由create_all建好的对象要跳过）
+MIGRATIONS = []
+
+def migration(version, name):
+    def decorator(fn):
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return decorator
+
+@migration(1, '报修单、图片、评价的热点查询索引')
+def add_hot_query_indexes():
+    connection = db.session.connection()
+    names = {'ix_repair_order_status_created_at', 'ix_repair_order_student_created_at',
+             'ix_repair_order_repairman_created_at', 'ix_repair_order_created_at',
+             'ix_repair_image_repair_order_id', 'ix_comment_repair_order_id'}
+    for model in (RepairOrder, RepairImage, Comment):
+        for index in model.__table__.indexes:
+            if index.name in names:
+                index.create(connection, checkfirst=True)
+
+@migration(2, '报修单全文检索索引')
+def add_fulltext_search():
+    setup_fulltext_search()
+
+@migration(3, '归档报修单纳入全文检索')
+def add_archive_fulltext_search():
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute(text('DROP TRIGGER IF EXISTS user_name_fts_update'))  # 重建触发器，学生改名时同步归档单
+    setup_fulltext_search()
+
+@migration(4, '报修单楼栋字段和重复报修合并')
+def add_duplicate_linking():
+    connection = db.session.connection()
+    for model in (RepairOrder, ArchivedRepairOrder):
+        model_table = model.__table__
+        existing = {c['name'] for c in inspect(connection).get_columns(model.__tablename__)}
+        for name in ('building', 'parent_id'):
+            if name not in existing:
+                connection.exec_driver_sql('ALTER TABLE %s ADD COLUMN %s %s' % (
+                    model.__tablename__, name, model_table.c[name].type.compile(connection.dialect)))
+        # 按宿舍信息回填楼栋
+        rooms = [room for room, in connection.execute(select(model_table.c.room).where(
+            model_table.c.building.is_(None)).distinct())]
+        if rooms:
+            connection.execute(update(model_table).where(model_table.c.room == bindparam('old_room'))
+                               .values(building=bindparam('new_building')),
+                               [{'old_room': room, 'new_building': parse_building(room)} for room in rooms])
+        for index in model_table.indexes:
+            index.create(connection, checkfirst=True)
+
+# SQLite的主键不带AUTOINCREMENT时会复用已删除的最大id，归档后新写入的报修单、图片、评价可能与归档表中的id重复。
+# 旧库按SQLite推荐的方式重建这三张表（改名、建新表、复制、删旧表），并把自增序列设为热表和归档表中的最大id
+@migration(5, '报修单、图片、评价主键改为AUTOINCREMENT')
+def add_autoincrement_ids():
+    if db.engine.dialect.name != 'sqlite':
+        return
+    connection = db.session.connection()
+    for hot, archive in ((RepairOrder, ArchivedRepairOrder), (RepairImage, ArchivedRepairImage),
+                         (Comment, ArchivedComment)):
+        name = hot.__tablename__
+        ddl = connection.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).scalar()
+        if 'AUTOINCREMENT' not in ddl.upper():
+            # legacy_alter_table下改名不会改写其他表外键和触发器中的表名，新表建好后这些引用仍指向原表名
+            connection.exec_driver_sql('PRAGMA legacy_alter_table=ON')
+            connection.exec_driver_sql('ALTER TABLE %s RENAME TO %s_old' % (name, name))
+            connection.exec_driver_sql('PRAGMA legacy_alter_table=OFF')
+            for index in hot.__table__.indexes:
+                connection.exec_driver_sql('DROP INDEX IF EXISTS %s' % index.name)
+            hot.__table__.create(connection)
+            columns = ', '.join(c.name for c in hot.__table__.columns)
+            connection.exec_driver_sql('INSERT INTO %s (%s) SELECT %s FROM %s_old' % (name, columns, columns, name))
+            connection.exec_driver_sql('DROP TABLE %s_old' % name)  # 报修单表上的检索触发器随旧表删除
+        connection.exec_driver_sql('DELETE FROM sqlite_sequence WHERE name = ?', (name,))
+        connection.exec_driver_sql(
+            'INSERT INTO sqlite_sequence (name, seq) SELECT ?, COALESCE(MAX(id), 0) FROM '
+            '(SELECT id FROM %s UNION ALL SELECT id FROM %s)' % (name, archive.__tablename__), (name,))
+    for ddl in SQLITE_FTS_DDL:
+        db.session.execute(text(ddl))
+
+def run_migrations():
+    applied = {m.version for m in SchemaMigration.query.all()}
+    done = []
+    for version, name, fn in MIGRATIONS:
+        if version in applied:
+            continue
+        try:
+            fn()
+            db.session.add(SchemaMigration(version=version, name=name))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        done.append((version, name))
+    return done
+
+# 执行计划检查：以各角色身份调用热点接口，收集实际执行的查询并逐条EXPLAIN，
+# 出现全表扫描（小字典表除外）时以非0状态退出，可放在部署流水线中
+QUERY_PLAN_CHECKS = [
+    ('student', '/api/repairs'),
+    ('student', '/api/repairs?status=pending,approved'),
+    ('repairman', '/api/repairs'),
+    ('admin', '/api/repairs?status=pending'),
+    ('admin', '/api/repairs?date_from=2024-01-01'),
+    ('admin', '/api/repairs/pending'),
+    ('admin', '/api/repairs/{order_id}'),
+    ('admin', '/api/comments/{order_id}'),
+    ('student', '/api/repairs?archived=1'),
+    ('repairman', '/api/repairs?archived=1'),
+]
+QUERY_PLAN_SMALL_TABLES = {'category', 'announcement', 'table_version', 'schema_migration'}
+
+def full_scan_tables(connection, statement, parameters):
+    if connection.dialect.name == 'sqlite':
+        plan = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+        tables = [m.group(1) for m in (re.match(r'SCAN (\w+)$', row[-1]) for row in plan) if m]
+    elif connection.dialect.name == 'mysql':
+        plan = connection.exec_driver_sql('EXPLAIN ' + statement, parameters).mappings().all()
+        tables = [row['table'] for row in plan if row['type'] == 'ALL']
+    else:
+        return []
+    return [t for t in tables if t not in QUERY_PLAN_SMALL_TABLES]
+
+def check_query_plans():
+    """以各角色身份调用热点接口，对执行的查询逐条EXPLAIN。
+    返回[(角色, URL, 查询数, [(全表扫描的表, SQL)])]，没有对应角色用户的接口查询数为None"""
+    users = {role: User.query.filter_by(role=role).first() for role in ('student', 'repairman', 'admin')}
+    order = RepairOrder.query.order_by(RepairOrder.id).first()
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith('SELECT'):
+            captured.append((statement, parameters))
+
+    client = current_app.test_client()
+    results = []
+    for role, url in QUERY_PLAN_CHECKS:
+        url = url.format(order_id=order.id if order else 1)
+        if users[role] is None:
+            results.append((role, url, None, []))
+            continue
+        token = create_access_token(identity=str(users[role].id), additional_claims=user_claims(users[role]))
+        captured.clear()
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            client.get(url, headers={'Authorization': 'Bearer ' + token})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+        scans = []
+        with db.engine.connect() as connection:
+            for statement, parameters in captured:
+                tables = full_scan_tables(connection, statement, parameters)
+                if tables:
+                    scans.append((tables, statement))
+        results.append((role, url, len(captured), scans))
+    return results
+
+@bp.cli.command('check-query-plans')
+def check_query_plans_command():
+    """检查热点接口的查询是否走索引"""
+    failures = 0
+    for role, url, count, scans in check_query_plans():
+        if count is None:
+            print('跳过 %s（没有%s用户）' % (url, role))
+            continue
+        for tables, statement in scans:
+            failures += 1
+            print('[全表扫描] %s %s: %s\n    %s' % (role, url, ', '.join(tables), ' '.join(statement.split())))
+        print('%s %s: %d条查询' % (role, url, count))
+    if failures:
+        raise SystemExit(1)
+    print('全部查询均使用索引')
+
+# 密码哈希执行器：哈希在固定大小的线程池中计算（hashlib计算时释放GIL），
+# 并发数和排队数都有上限，排满时立即返回503，避免登录高峰拖垮其他接口
+class HashBusyError(Exception):
+    pass
+
+class BoundedHashExecutor:
+    def __init__(self, workers, queue_limit):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+
+    def run(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            raise HashBusyError()
+        try:
+            return self._executor.submit(fn, *args, **kwargs).result()
+        finally:
+            self._slots.release()
+
+_hash_executor = None
+_hash_executor_lock = threading.Lock()
+
+def get_hash_executor():
+    global _hash_executor
+    with _hash_executor_lock:
+        if _hash_executor is None:
+            _hash_executor = BoundedHashExecutor(current_app.config['HASH_WORKERS'], current_app.config['HASH_QUEUE_LIMIT'])
+        return _hash_executor
+
+# 哈希耗时包含排队等待线程池的时间
+def hash_password(password):
+    start = time.perf_counter()
+    result = get_hash_executor().run(generate_password_hash, password, method=current_app.config['PASSWORD_HASH_METHOD'])
+    PASSWORD_HASH_DURATION.observe(time.perf_counter() - start, 'hash')
+    return result
+
+def verify_password(password_hash, password):
+    start = time.perf_counter()
+    result = get_hash_executor().run(check_password_hash, password_hash, password)
+    PASSWORD_HASH_DURATION.observe(time.perf_counter() - start, 'verify')
+    return result
+
+_dummy_password_hash = None
+
+def get_dummy_password_hash():
+    global _dummy_password_hash
+    if _dummy_password_hash is None:
+        _dummy_password_hash = hash_password(os.urandom(16).hex())
+    return _dummy_password_hash
+
+def password_needs_rehash(password_hash):
+    return password_hash.split('$', 1)[0] != current_app.config['PASSWORD_HASH_METHOD']
+
+@bp.app_errorhandler(HashBusyError)
+def handle_hash_busy(e):
+    response = jsonify({'code': 503, 'msg': '服务繁忙，请稍后重试'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+# 等待SQLite写锁超过busy_timeout（如执行VACUUM期间）时返回503，其他数据库错误返回JSON格式的500
+@bp.app_errorhandler(OperationalError)
+def handle_database_error(e):
+    db.session.rollback()
+    if 'database is locked' in str(e.orig):
+        return handle_hash_busy(e)
+    response = jsonify({'code': 500, 'msg': '数据库错误', 'error': str(e.orig)})
+    response.status_code = 500
+    return response
+
+# 限流：令牌桶算法，每个键一个桶，按固定速率补充令牌，桶满即为突发上限。
+# 计数存储可替换：默认进程内存储；多进程部署时配置redis://地址，所有worker共享同一组桶
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+RATE_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600}
+
+def parse_rate_limit(value):
+    """'20/minute' -> (容量20, 每秒补充20/60个令牌)"""
+    count, _, period = value.partition('/')
+    return int(count), int(count) / RATE_PERIODS[period.strip()]
+
+class InProcessRateLimitStore:
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()  # key -> (剩余令牌, 更新时间)
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, rate, cost=1):
+        """扣除令牌，成功返回0，否则返回需要等待的秒数"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0
+            else:
+                wait = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            # 键过多时淘汰最久未访问的桶（被淘汰的桶相当于已补满）
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+class RedisRateLimitStore:
+    # 在Redis中原子地完成补充和扣除，桶在补满所需时间后自动过期
+    SCRIPT = """
+    local capacity, rate, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + (now - updated) * rate)
+    local wait = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+    else
+        wait = (cost - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url, prefix='ratelimit:'):
+        if redis is None:
+            raise RuntimeError('RATELIMIT_STORAGE_URL使用Redis时需要安装redis包')
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def consume(self, key, capacity, rate, cost=1):
+        return float(self._script(keys=[self.prefix + key], args=[capacity, rate, cost]))
+
+    def reset(self, key):
+        self._client.delete(self.prefix + key)
+
+_rate_limit_store = None
+_rate_limit_store_lock = threading.Lock()
+
+def get_rate_limit_store():
+    global _rate_limit_store
+    with _rate_limit_store_lock:
+        if _rate_limit_store is None:
+            url = current_app.config['RATELIMIT_STORAGE_URL']
+            if url.startswith('memory://'):
+                _rate_limit_store = InProcessRateLimitStore()
+            elif url.startswith(('redis://', 'rediss://', 'unix://')):
+                _rate_limit_store = RedisRateLimitStore(url)
+            else:
+                raise RuntimeError('不支持的RATELIMIT_STORAGE_URL: %s' % url)
+        return _rate_limit_store
+
+def check_rate_limit(scope, identity, limit_name):
+    if not current_app.config['RATELIMIT_ENABLED']:
+        return
+    capacity, rate = parse_rate_limit(current_app.config[limit_name])
+    wait = get_rate_limit_store().consume('%s:%s' % (scope, identity), capacity, rate)
+    if wait > 0:
+        raise RateLimitExceeded(wait)
+
+def reset_rate_limit(scope, identity):
+    get_rate_limit_store().reset('%s:%s' % (scope, identity))
+
+def rate_limit(limit_name, per='user'):
+    """按接口限流，per='user'按登录用户计数（须放在登录校验装饰器之后），per='ip'按客户端IP计数"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if per == 'user':
+                identity = g.get('user_id') or get_jwt_identity()
+            else:
+                identity = request.remote_addr
+            check_rate_limit(request.endpoint, identity, limit_name)
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@bp.app_errorhandler(RateLimitExceeded)
+def handle_rate_limit_exceeded(e):
+    response = jsonify({'code': 429, 'msg': '请求过于频繁，请稍后再试'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+    return response
+
+# 建表、执行迁移并补齐数据版本号和统计汇总，可重复执行。启动应用时不再访问数据库，部署时执行 flask init-db
+def init_db():
     db.create_all()
+    done = run_migrations()
+    # 初始化数据版本号
+    existing_versions = {v.name for v in TableVersion.query.all()}
+    for name in VERSIONED_TABLES:
+        if name not in existing_versions:
+            db.session.add(TableVersion(name=name, version=0))
+    db.session.commit()
+    # 已有历史数据但汇总表为空时，补建一次统计
+    if not DailyRepairStat.query.first() and RepairOrder.query.first():
+        rebuild_daily_stats()
+    if not RatingAggregate.query.first() and Comment.query.first():
+        rebuild_rating_aggregates()
+    return done
+
+# 写入初始账号和故障分类，已存在的跳过（flask seed）
+def seed_db():
     # 添加默认用户
-    from werkzeug.security import generate_password_hash
-    
     # 管理员用户
     admin = User.query.filter_by(username='admin').first()
     if not admin:
         admin = User(
             username='admin',
-            password=generate_password_hash('123456'),
+            password=generate_password_hash('123456', method=current_app.config['PASSWORD_HASH_METHOD']),
             name='系统管理员',
             role='admin',
             phone='13800138000',
@@ -104,7 +1227,7 @@ with app.app_context():
     if not student:
         student = User(
             username='20210001',
-            password=generate_password_hash('123456'),
+            password=generate_password_hash('123456', method=current_app.config['PASSWORD_HASH_METHOD']),
             name='张三',
             role='student',
             phone='13800138001',
@@ -117,7 +1240,7 @@ with app.app_context():
     if not repairman:
         repairman = User(
             username='repair001',
-            password=generate_password_hash('123456'),
+            password=generate_password_hash('123456', method=current_app.config['PASSWORD_HASH_METHOD']),
             name='李师傅',
             role='repairman',
             phone='13800138002',
@@ -135,23 +1258,1016 @@ with app.app_context():
             db.session.add(cat)
     db.session.commit()
 
+@bp.cli.command('init-db')
+def init_db_command():
+    """建表并执行未应用的数据库迁移"""
+    for version, name in init_db():
+        print('已执行迁移 %d: %s' % (version, name))
+    print('数据库初始化完成')
+
+@bp.cli.command('seed')
+def seed_command():
+    """写入初始账号和故障分类"""
+    seed_db()
+    print('初始数据写入完成')
+
+# 进程内缓存：TTL过期 + LRU淘汰，用于分类、公告、用户等变化很少的基础数据
+class TTLCache:
+    def __init__(self, name, ttl=60, maxsize=1024):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (过期时间, value)
+        self._generation = 0  # 每次失效加1，防止失效前开始的加载把旧数据写回
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item and item[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, generation=None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_load(self, key, loader):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            generation = self._generation
+            value = loader()
+            self.set(key, value, generation)
+        return value
+
+    def invalidate(self, key=None):
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'name': self.name,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else None
+        }
+
+category_cache = TTLCache('categories', ttl=600, maxsize=16)
+announcement_cache = TTLCache('announcements', ttl=300, maxsize=16)
+user_cache = TTLCache('users', ttl=60, maxsize=4096)
+user_role_cache = TTLCache('user_roles', ttl=30, maxsize=4096)
+CACHES = [category_cache, announcement_cache, user_cache, user_role_cache]
+
+# 用户信息变化时的失效钩子（公告列表中包含作者姓名，一并失效）
+def invalidate_user_caches(user_id):
+    user_cache.invalidate(user_id)
+    user_role_cache.invalidate(user_id)
+    announcement_cache.invalidate()
+
+# 权限校验：角色和用户版本号写在JWT附加声明中。每次鉴权按用户查询当前角色和版本号（结果缓存30秒），
+# 多worker部署时其他进程中的降权、删除最多延迟一个缓存周期生效；本进程内修改用户时立即失效缓存。
+# 令牌版本比缓存新说明缓存落后于其他进程的修改，此时立即回查
+def user_version(user):
+    return user.updated_at.isoformat() if user.updated_at else ''
+
+def user_claims(user):
+    return {'role': user.role, 'ver': user_version(user)}
+
+def lookup_user_state(user_id):
+    """返回 (角色, 版本号)，用户不存在时返回None"""
+    def load():
+        user = db.session.get(User, user_id)
+        return (user.role, user_version(user)) if user else None
+    return user_role_cache.get_or_load(user_id, load)
+
+def lookup_user_role(user_id):
+    state = lookup_user_state(user_id)
+    return state[0] if state else None
+
+def current_role(user_id, claims):
+    state = lookup_user_state(user_id)
+    if state is not None and claims.get('ver', '') > state[1]:
+        user_role_cache.invalidate(user_id)
+        state = lookup_user_state(user_id)
+    return state[0] if state else None
+
+def role_required(*roles, msg='权限不足', locations=None):
+    """校验登录及角色，通过后当前用户ID和角色保存在g.user_id、g.role"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        @jwt_required(locations=locations)
+        def wrapper(*args, **kwargs):
+            g.user_id = int(get_jwt_identity())
+            g.role = current_role(g.user_id, get_jwt())
+            # 结束鉴权查询开启的事务，写请求的写锁从接口自己的第一条查询开始持有，不覆盖图片处理等前置计算
+            db.session.rollback()
+            if g.role is None:
+                return jsonify({'code': 401, 'msg': '用户不存在'})
+            if roles and g.role not in roles:
+                return jsonify({'code': 403, 'msg': msg})
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# 事件推送：进程内发布/订阅。替换为本地消息代理（如Redis pub/sub）时，
+# 只需提供同样的publish/subscribe/unsubscribe接口并赋值给event_broker
+class InProcessEventBroker:
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def publish(self, event):
+        event = dict(event, id=next(self._ids))
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                pass  # 客户端消费过慢时丢弃，客户端重连后会重新拉取列表
+
+event_broker = InProcessEventBroker()
+
+# 报修单事件：提交前一次性写入事件日志（批量操作只有一条executemany），提交后才推送，回滚则都丢弃
+def queue_order_event(event_type, order):
+    db.session.info.setdefault('pending_event_rows', []).append({
+        'order_id': order.id,
+        'type': event_type,
+        'status': order.status,
+        'student_id': order.student_id,
+        'repairman_id': order.repairman_id,
+        'actor_id': g.get('user_id') if has_request_context() else None,
+        'created_at': datetime.now()
+    })
+    db.session.info.setdefault('pending_events', []).append({
+        'type': event_type,
+        'order_id': order.id,
+        'status': order.status,
+        'student_id': order.student_id,
+        'repairman_id': order.repairman_id,
+        'room': order.room,
+        'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    })
+
+@event.listens_for(Session, 'before_commit')
+def write_pending_event_rows(session):
+    rows = session.info.pop('pending_event_rows', None)
+    if rows:
+        session.connection().execute(OrderEvent.__table__.insert(), rows)
+        bump_table_versions(session, ['order_event'])  # 列表接口返回的changes_cursor随事件变化
+
+@event.listens_for(Session, 'after_commit')
+def publish_pending_events(session):
+    for order_event in session.info.pop('pending_events', []):
+        event_broker.publish(order_event)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_pending_events(session):
+    session.info.pop('pending_events', None)
+    session.info.pop('pending_event_rows', None)
+
+# 按角色过滤：管理员接收全部；维修人员接收任务大厅变化（审核通过、被接单、被派单）及自己的任务；学生只接收自己的报修单
+def event_visible_to(order_event, user_id, role):
+    if role == 'admin':
+        return True
+    if role == 'repairman':
+        return order_event['type'] in ('approved', 'accepted', 'assigned') or order_event['repairman_id'] == user_id
+    return order_event['student_id'] == user_id
+
+# 报修单状态机：每次状态流转是一条带原状态条件的UPDATE，
+# 并发请求中只有一个能更新成功，其余返回409冲突
+ORDER_TRANSITIONS = {
+    # 动作: (原状态, 新状态, 状态不符时的提示)
+    'approve': ('pending', 'approved', '只有待处理的报修单可以被审核'),
+    'reject': ('pending', 'rejected', '只有待处理的报修单可以被拒绝'),
+    'accept': ('approved', 'repairing', '只有已审核的报修单可以被接受'),
+    'complete': ('repairing', 'completed', '只有维修中的任务可以被完成'),
+    'assign': ('approved', 'repairing', '只有已审核的报修单可以派单'),
+}
+
+class OrderTransitionError(Exception):
+    def __init__(self, code, msg):
+        super().__init__(msg)
+        self.code = code
+        self.msg = msg
+
+def transition_clauses(action, repairman_id=None, duplicates=False):
+    from_status, to_status, conflict_msg = ORDER_TRANSITIONS[action]
+    values = {'status': to_status}
+    conditions = [RepairOrder.status == from_status]
+    if not duplicates:
+        conditions.append(RepairOrder.parent_id.is_(None))  # 合并的重复报修单随主报修单流转，不能单独处理
+    if action in ('accept', 'assign'):
+        values['repairman_id'] = repairman_id
+    elif action == 'complete':
+        values['completed_at'] = datetime.now()
+        conditions.append(RepairOrder.repairman_id == repairman_id)
+    return conditions, values
+
+def transition_order(order_id, action, repairman_id=None):
+    """执行状态流转，成功返回更新后的报修单，失败抛出OrderTransitionError"""
+    from_status, to_status, conflict_msg = ORDER_TRANSITIONS[action]
+    conditions, values = transition_clauses(action, repairman_id)
+    result = db.session.execute(update(RepairOrder).where(RepairOrder.id == order_id, *conditions).values(**values),
+                                execution_options={'synchronize_session': False})
+    if result.rowcount != 1:
+        current = db.session.query(RepairOrder.status, RepairOrder.repairman_id, RepairOrder.parent_id) \
+            .filter_by(id=order_id).first()
+        if current is None:
+            raise OrderTransitionError(404, '报修单不存在')
+        if current.parent_id is not None:
+            raise OrderTransitionError(409, duplicate_conflict_msg(current.parent_id))
+        if action == 'complete' and current.status == from_status:
+            raise OrderTransitionError(403, '您不是这个任务的负责人')
+        raise OrderTransitionError(409, conflict_msg)
+    transition_duplicates([order_id], action, repairman_id)
+    return db.session.get(RepairOrder, order_id, populate_existing=True)
+
+def transition_orders(order_ids, action, repairman_id=None, duplicates=False):
+    """批量状态流转：一条UPDATE完成，返回实际更新成功的ID集合"""
+    conditions, values = transition_clauses(action, repairman_id, duplicates)
+    conditions.append(RepairOrder.id.in_(order_ids))
+    if db.engine.dialect.update_returning:
+        stmt = update(RepairOrder).where(*conditions).values(**values).returning(RepairOrder.id)
+        updated_ids = {row[0] for row in db.session.execute(stmt, execution_options={'synchronize_session': False})}
+    else:
+        # 不支持RETURNING的数据库（如MySQL）先加行锁选出符合条件的记录
+        updated_ids = {row[0] for row in db.session.query(RepairOrder.id).filter(*conditions).with_for_update()}
+        if updated_ids:
+            db.session.execute(update(RepairOrder).where(RepairOrder.id.in_(updated_ids)).values(**values),
+                               execution_options={'synchronize_session': False})
+    if updated_ids and not duplicates:
+        transition_duplicates(updated_ids, action, repairman_id)
+    return updated_ids
+
+# 重复报修：合并到主报修单的报修单状态与主报修单保持一致，主报修单流转时一并流转并各自记录事件；
+# 同一次维修只在主报修单上计入完成统计
+TRANSITION_EVENT_TYPES = {'approve': 'approved', 'reject': 'rejected', 'accept': 'accepted',
+                          'assign': 'assigned', 'complete': 'completed'}
+OPEN_STATUSES = ('pending', 'approved', 'repairing')
+
+def duplicate_conflict_msg(parent_id):
+    return '该报修单已合并到报修单#%d，请处理主报修单' % parent_id
+
+def transition_duplicates(parent_ids, action, repairman_id=None):
+    child_ids = [order_id for order_id, in db.session.query(RepairOrder.id).filter(RepairOrder.parent_id.in_(parent_ids))]
+    if not child_ids:
+        return
+    updated_ids = transition_orders(child_ids, action, repairman_id, duplicates=True)
+    for order in RepairOrder.query.filter(RepairOrder.id.in_(updated_ids)):
+        queue_order_event(TRANSITION_EVENT_TYPES[action], order)
+
+# 描述相似度：去掉空白和标点后取单字和相邻两字作为特征集合，计算Jaccard系数。
+# 候选只有同楼栋同分类的少量报修单，直接比较集合即可，不需要MinHash之类的近似算法
+def description_shingles(description):
+    chars = [ch for ch in (description or '').lower() if ch.isalnum()]
+    return set(chars) | {a + b for a, b in zip(chars, chars[1:])}
+
+def shingle_similarity(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+def find_duplicate_parent(category_id, room, building, description):
+    """在同楼栋、同分类、近期未关闭的主报修单中找描述最相似且达到阈值的一条，返回(id, status, repairman_id)或None"""
+    config = current_app.config
+    since = datetime.now() - timedelta(hours=config['DUPLICATE_WINDOW_HOURS'])
+    candidates = db.session.query(RepairOrder.id, RepairOrder.room, RepairOrder.description).filter(
+        RepairOrder.category_id == category_id, RepairOrder.building == building, RepairOrder.created_at >= since,
+        RepairOrder.status.in_(OPEN_STATUSES), RepairOrder.parent_id.is_(None)
+    ).order_by(RepairOrder.created_at).limit(config['DUPLICATE_MAX_CANDIDATES']).all()
+    shingles = description_shingles(description)
+    best_id, best_score = None, 0.0
+    for candidate in candidates:
+        threshold = config['DUPLICATE_SIMILARITY_SAME_ROOM'] if candidate.room == room else config['DUPLICATE_SIMILARITY']
+        score = shingle_similarity(shingles, description_shingles(candidate.description))
+        if score >= threshold and score > best_score:
+            best_id, best_score = candidate.id, score
+    if best_id is None:
+        return None
+    # 加锁重新读取主报修单的状态，避免合并时它恰好被审核或完成
+    return db.session.query(RepairOrder.id, RepairOrder.status, RepairOrder.repairman_id).filter(
+        RepairOrder.id == best_id, RepairOrder.status.in_(OPEN_STATUSES), RepairOrder.parent_id.is_(None)
+    ).with_for_update().first()
+
+# 自动派单：把已审核的报修单分配给维修人员。按预约时间（无预约按提交时间）先后处理，
+# 优先选择负责该楼栋或手头已有该楼栋任务的维修人员，其次选择同分类中进行中任务最少的；
+# 同一维修人员的预约需间隔DISPATCH_SLOT_MINUTES。候选人按(负载, ID)放在小顶堆中，
+# 每个“分类”和“分类+楼栋”各一个堆，负载变化时压入新条目，旧条目在出堆时识别并丢弃
+DispatchOrder = namedtuple('DispatchOrder', 'id category_id building appointment_time created_at')
+
+def plan_dispatch(orders, repairmen, max_open_tasks, slot):
+    """orders为DispatchOrder列表；repairmen为 {维修人员ID: {'categories': 分类ID集合（None表示全部）,
+    'buildings': 楼栋集合, 'load': 进行中任务数, 'appointments': 已有预约时间列表}}。
+    返回 [(报修单ID, 维修人员ID, 是否同楼栋)]，不修改传入的数据"""
+    all_categories = {order.category_id for order in orders}
+    load = {}
+    appointments = {}
+    memberships = {}  # 维修人员ID -> 所在的堆
+    heaps = {}
+
+    def join(repairman_id, key):
+        if key not in memberships[repairman_id]:
+            memberships[repairman_id].add(key)
+            heapq.heappush(heaps.setdefault(key, []), (load[repairman_id], repairman_id))
+
+    for repairman_id, info in repairmen.items():
+        load[repairman_id] = info['load']
+        appointments[repairman_id] = list(info['appointments'])
+        memberships[repairman_id] = set()
+        if load[repairman_id] >= max_open_tasks:
+            continue
+        categories = all_categories if info['categories'] is None else info['categories'] & all_categories
+        for category_id in categories:
+            join(repairman_id, (category_id, None))
+            for building in info['buildings']:
+                join(repairman_id, (category_id, building))
+
+    def available(repairman_id, appointment_time):
+        if appointment_time is None:
+            return True
+        return all(abs(appointment_time - booked) >= slot for booked in appointments[repairman_id])
+
+    def pick(key, appointment_time):
+        heap = heaps.get(key)
+        chosen = None
+        skipped = []
+        while heap:
+            entry_load, repairman_id = heap[0]
+            if entry_load != load[repairman_id] or load[repairman_id] >= max_open_tasks:
+                heapq.heappop(heap)  # 过期条目或已满
+                continue
+            if not available(repairman_id, appointment_time):
+                skipped.append(heapq.heappop(heap))
+                continue
+            chosen = repairman_id
+            break
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+        return chosen
+
+    pending = [(order.appointment_time or order.created_at, order.created_at, order.id, order) for order in orders]
+    heapq.heapify(pending)
+    plan = []
+    while pending:
+        order = heapq.heappop(pending)[3]
+        repairman_id = pick((order.category_id, order.building), order.appointment_time)
+        nearby = repairman_id is not None
+        if not nearby:
+            repairman_id = pick((order.category_id, None), order.appointment_time)
+            if repairman_id is None:
+                continue
+        plan.append((order.id, repairman_id, nearby))
+        load[repairman_id] += 1
+        if order.appointment_time is not None:
+            appointments[repairman_id].append(order.appointment_time)
+        if load[repairman_id] < max_open_tasks:
+            for key in memberships[repairman_id]:
+                heapq.heappush(heaps[key], (load[repairman_id], repairman_id))
+            # 接了这个楼栋的任务后，同楼栋的其他报修单优先派给他
+            for category_id in {key[0] for key in memberships[repairman_id]}:
+                join(repairman_id, (category_id, order.building))
+    return plan
+
+def load_dispatch_state(now):
+    config = current_app.config
+    horizon = now + timedelta(hours=config['DISPATCH_HORIZON_HOURS'])
+    rows = db.session.query(RepairOrder.id, RepairOrder.category_id, RepairOrder.room,
+                            RepairOrder.appointment_time, RepairOrder.created_at) \
+        .filter(RepairOrder.status == 'approved', RepairOrder.parent_id.is_(None),
+                or_(RepairOrder.appointment_time.is_(None), RepairOrder.appointment_time <= horizon)) \
+        .order_by(RepairOrder.created_at).limit(config['DISPATCH_BATCH_SIZE']).all()
+    orders = [DispatchOrder(row.id, row.category_id, parse_building(row.room), row.appointment_time, row.created_at)
+              for row in rows]
+
+    repairmen = {user.id: {'name': user.name, 'categories': None, 'buildings': set(), 'load': 0, 'appointments': []}
+                 for user in User.query.filter_by(role='repairman')}
+    for skill in RepairmanSkill.query.filter(RepairmanSkill.repairman_id.in_(repairmen)):
+        info = repairmen[skill.repairman_id]
+        info['categories'] = (info['categories'] or set()) | {skill.category_id}
+    for area in RepairmanArea.query.filter(RepairmanArea.repairman_id.in_(repairmen)):
+        repairmen[area.repairman_id]['buildings'].add(area.building)
+    # 进行中的任务：计入负载，其楼栋视为“附近”，其预约占用时间段（合并的重复报修不单独计入）
+    for row in db.session.query(RepairOrder.repairman_id, RepairOrder.room, RepairOrder.appointment_time) \
+            .filter(RepairOrder.status == 'repairing', RepairOrder.parent_id.is_(None),
+                    RepairOrder.repairman_id.in_(repairmen)):
+        info = repairmen[row.repairman_id]
+        info['load'] += 1
+        info['buildings'].add(parse_building(row.room))
+        if row.appointment_time is not None:
+            info['appointments'].append(row.appointment_time)
+    return orders, repairmen
+
+def run_dispatch(dry_run=False):
+    """执行一轮派单并返回结果摘要；dry_run时只计算方案不写入"""
+    started = time.perf_counter()
+    orders, repairmen = load_dispatch_state(datetime.now())
+    plan = plan_dispatch(orders, repairmen, current_app.config['DISPATCH_MAX_OPEN_TASKS'],
+                         timedelta(minutes=current_app.config['DISPATCH_SLOT_MINUTES']))
+    assigned_ids = {order_id for order_id, _, _ in plan}
+    if not dry_run and plan:
+        by_repairman = {}
+        for order_id, repairman_id, _ in plan:
+            by_repairman.setdefault(repairman_id, []).append(order_id)
+        try:
+            # 条件UPDATE只会更新仍处于已审核状态的报修单，期间被人工接单的自动跳过
+            assigned_ids = set()
+            for repairman_id, order_ids in by_repairman.items():
+                assigned_ids |= transition_orders(order_ids, 'assign', repairman_id=repairman_id)
+            if assigned_ids:
+                for order in RepairOrder.query.filter(RepairOrder.id.in_(assigned_ids)):
+                    queue_order_event('assigned', order)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    buildings = {order.id: order.building for order in orders}
+    return {
+        'dry_run': dry_run,
+        'considered': len(orders),
+        'assigned': len(assigned_ids),
+        'unassigned': len(orders) - len(assigned_ids),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        'plan': [{
+            'order_id': order_id,
+            'repairman_id': repairman_id,
+            'repairman_name': repairmen[repairman_id]['name'],
+            'building': buildings[order_id],
+            'nearby': nearby
+        } for order_id, repairman_id, nearby in plan if order_id in assigned_ids]
+    }
+
+def dispatch_loop(app, interval):
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                result = run_dispatch()
+                if result['assigned']:
+                    app.logger.info('自动派单：%d/%d', result['assigned'], result['considered'])
+            except Exception:
+                app.logger.exception('自动派单失败')
+
+@bp.cli.command('dispatch')
+@click.option('--dry-run', is_flag=True, help='只计算派单方案，不写入')
+@click.option('--loop', 'interval', type=int, default=0, help='每隔N秒执行一次')
+def dispatch_command(dry_run, interval):
+    """把已审核的报修单自动分配给维修人员"""
+    while True:
+        result = run_dispatch(dry_run=dry_run)
+        for item in result['plan']:
+            print('报修单%(order_id)d -> %(repairman_name)s（%(building)s）' % item)
+        print('待派%d条，派出%d条，耗时%.1fms' % (result['considered'], result['assigned'], result['elapsed_ms']))
+        if not interval:
+            break
+        time.sleep(interval)
+
+@bp.cli.command('dispatch-benchmark')
+@click.option('--orders', 'order_count', type=int, default=5000)
+@click.option('--repairmen', 'repairman_count', type=int, default=100)
+@click.option('--buildings', 'building_count', type=int, default=30)
+@click.option('--categories', 'category_count', type=int, default=5)
+@click.option('--seed', type=int, default=1)
+def dispatch_benchmark_command(order_count, repairman_count, building_count, category_count, seed):
+    """用随机生成的数据测试派单算法的耗时和分配结果（不访问数据库）"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    buildings = ['%d号楼' % (i + 1) for i in range(building_count)]
+    orders = [DispatchOrder(i, rng.randrange(category_count), rng.choice(buildings),
+                            now + timedelta(minutes=rng.randrange(24 * 60)) if rng.random() < 0.3 else None,
+                            now - timedelta(minutes=rng.randrange(7 * 24 * 60)))
+              for i in range(order_count)]
+    repairmen = {i: {'categories': set(rng.sample(range(category_count), rng.randint(1, category_count)))
+                     if rng.random() < 0.7 else None,
+                     'buildings': set(rng.sample(buildings, 2)),
+                     'load': rng.randrange(3), 'appointments': []}
+                 for i in range(repairman_count)}
+    max_open = current_app.config['DISPATCH_MAX_OPEN_TASKS']
+    started = time.perf_counter()
+    plan = plan_dispatch(orders, repairmen, max_open, timedelta(minutes=current_app.config['DISPATCH_SLOT_MINUTES']))
+    elapsed = (time.perf_counter() - started) * 1000
+    loads = [info['load'] for info in repairmen.values()]
+    for _, repairman_id, _ in plan:
+        loads[repairman_id] += 1
+    capacity = sum(max(max_open - info['load'], 0) for info in repairmen.values())
+    print('报修单%d条，维修人员%d名，可用名额%d' % (order_count, repairman_count, capacity))
+    print('派出%d条（同楼栋%d条），耗时%.1fms' % (len(plan), sum(1 for item in plan if item[2]), elapsed))
+    print('派单后负载：最少%d，最多%d' % (min(loads), max(loads)))
+
+# 归档：已完成、已拒绝的报修单关闭超过ARCHIVE_AFTER_DAYS天后，连同图片和评价分批移入归档表，热表及其索引只保留
+# 进行中和近期的数据。每批一个事务，避免长时间持有写锁；全部移完后更新统计信息，SQLite空闲页较多时再整理数据库文件
+ARCHIVE_STATUSES = ('completed', 'rejected')
+ARCHIVE_TABLES = [
+    (RepairOrder, ArchivedRepairOrder, 'id'),
+    (RepairImage, ArchivedRepairImage, 'repair_order_id'),
+    (Comment, ArchivedComment, 'repair_order_id'),
+]
+
+def archive_order_batch(cutoff, batch_size):
+    """把一批关闭时间早于cutoff的报修单移入归档表（不提交），返回移动的报修单id"""
+    # 先更新数据版本号，事务一开始就取得写锁，SQLite下不会因先读后写升级写锁失败
+    bump_table_versions(db.session, [t.__tablename__ for hot, archive, _ in ARCHIVE_TABLES for t in (hot, archive)])
+    order_ids = [order_id for order_id, in db.session.query(RepairOrder.id).filter(
+        RepairOrder.status.in_(ARCHIVE_STATUSES), RepairOrder.updated_at < cutoff
+    ).order_by(RepairOrder.id).limit(batch_size).with_for_update()]
+    if not order_ids:
+        return []
+
+    connection = db.session.connection()
+    archived_at = datetime.now()
+    for hot, archive, key in ARCHIVE_TABLES:
+        columns = list(hot.__table__.columns)
+        source = select(*columns).where(hot.__table__.c[key].in_(order_ids))
+        names = [c.name for c in columns]
+        if 'archived_at' in archive.__table__.c:
+            source = source.add_columns(literal(archived_at, db.DateTime))
+            names.append('archived_at')
+        connection.execute(insert(archive.__table__).from_select(names, source))
+    for hot, archive, key in reversed(ARCHIVE_TABLES):
+        connection.execute(delete(hot.__table__).where(hot.__table__.c[key].in_(order_ids)))
+    if db.engine.dialect.name == 'sqlite':
+        # 热表的删除触发器会把检索索引中的记录一并删除，归档单重新写入（rowid不变），检索时仍能查到
+        connection.execute(insert(repair_order_fts).from_select(
+            ['rowid', 'room', 'description', 'student_name'],
+            select(ArchivedRepairOrder.id, ArchivedRepairOrder.room, ArchivedRepairOrder.description, User.name)
+            .outerjoin(User, User.id == ArchivedRepairOrder.student_id).where(ArchivedRepairOrder.id.in_(order_ids))))
+    return order_ids
+
+def optimize_database(vacuum=None):
+    """归档后的维护：更新查询优化器的统计信息；vacuum为None时按空闲页占比决定是否整理数据库文件"""
+    done = []
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        # VACUUM不能在事务中执行，直接使用驱动连接（连接已关闭驱动的自动事务）
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute('PRAGMA analysis_limit=1000')  # 每个索引只抽样分析，大表上也很快
+            cursor.execute('ANALYZE')
+            done.append('ANALYZE')
+            if vacuum is None:
+                page_count = cursor.execute('PRAGMA page_count').fetchone()[0]
+                free_pages = cursor.execute('PRAGMA freelist_count').fetchone()[0]
+                vacuum = page_count > 0 and free_pages / page_count > current_app.config['ARCHIVE_VACUUM_FREE_RATIO']
+            if vacuum:
+                cursor.execute('VACUUM')
+                done.append('VACUUM')
+        finally:
+            connection.close()
+    elif dialect == 'mysql':
+        tables = ', '.join(t.__tablename__ for hot, archive, _ in ARCHIVE_TABLES for t in (hot, archive))
+        with db.engine.connect() as connection:
+            if vacuum:
+                connection.exec_driver_sql('OPTIMIZE TABLE ' + tables).all()
+                done.append('OPTIMIZE TABLE')
+            connection.exec_driver_sql('ANALYZE TABLE ' + tables).all()
+            done.append('ANALYZE TABLE')
+    return done
+
+def run_archive(days=None, batch_size=None, vacuum=None):
+    """归档所有满足条件的报修单并返回结果摘要"""
+    started = time.perf_counter()
+    days = current_app.config['ARCHIVE_AFTER_DAYS'] if days is None else days
+    batch_size = batch_size or current_app.config['ARCHIVE_BATCH_SIZE']
+    cutoff = datetime.now() - timedelta(days=days)
+    archived = batches = 0
+    while True:
+        try:
+            order_ids = archive_order_batch(cutoff, batch_size)
+            if not order_ids:
+                db.session.rollback()  # 没有可归档的报修单，撤销版本号更新
+                break
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        archived += len(order_ids)
+        batches += 1
+    maintenance = optimize_database(vacuum) if archived or vacuum else []
+    return {
+        'archived': archived,
+        'batches': batches,
+        'cutoff': cutoff.strftime('%Y-%m-%d %H:%M:%S'),
+        'maintenance': maintenance,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+
+def archive_loop(app, interval):
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                result = run_archive()
+                if result['archived']:
+                    app.logger.info('归档报修单%d条（%s）', result['archived'], ', '.join(result['maintenance']))
+            except Exception:
+                app.logger.exception('归档失败')
+
+@bp.cli.command('archive')
+@click.option('--older-than', 'days', type=int, default=None, help='归档关闭超过N天的报修单，默认ARCHIVE_AFTER_DAYS')
+@click.option('--batch-size', type=int, default=None, help='每个事务移动的报修单数，默认ARCHIVE_BATCH_SIZE')
+@click.option('--vacuum/--no-vacuum', default=None, help='归档后是否整理数据库文件，默认按空闲页占比决定')
+@click.option('--loop', 'interval', type=int, default=0, help='每隔N秒执行一次')
+def archive_command(days, batch_size, vacuum, interval):
+    """把关闭已久的报修单连同图片、评价移入归档表"""
+    while True:
+        result = run_archive(days=days, batch_size=batch_size, vacuum=vacuum)
+        print('归档%d条（%d批，关闭时间早于%s），维护：%s，耗时%.1fms' % (
+            result['archived'], result['batches'], result['cutoff'], '、'.join(result['maintenance']) or '无',
+            result['elapsed_ms']))
+        if not interval:
+            break
+        time.sleep(interval)
+
+# 进程内缓存的键：在条件GET请求中加入相关表的版本号，保证响应体与ETag来自同一版本的数据。
+# 多worker部署时其他进程修改数据只会更新数据库中的版本号，不会清空本进程的缓存
+def versioned_cache_key(key, *tables):
+    versions = g.get('table_versions') if has_request_context() else None
+    if versions is None:
+        return key
+    return (key,) + tuple(versions.get(name) for name in tables)
+
+# 条件GET：ETag由相关表的版本号、当前用户和查询参数计算，数据未变化时直接返回304，
+# 不执行查询和序列化
+def conditional_json(*tables):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            versions = TableVersion.query.filter(TableVersion.name.in_(tables)).order_by(TableVersion.name).all()
+            g.table_versions = {v.name: v.version for v in versions}
+            key = '|'.join(['%s:%d' % (v.name, v.version) for v in versions] + [
+                request.path, request.query_string.decode(), str(getattr(g, 'user_id', '')), getattr(g, 'role', '') or ''])
+            etag = hashlib.sha1(key.encode()).hexdigest()
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = current_app.make_response(fn(*args, **kwargs))
+            response.set_etag(etag, weak=True)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
+
+# 响应压缩：较大的JSON/文本响应按客户端支持使用br或gzip
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_MIMETYPES = ('application/json', 'text/html', 'text/csv', 'text/plain', 'text/css', 'application/javascript')
+
+@bp.after_app_request
+def compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    accept_encoding = request.accept_encodings
+    if brotli is not None and accept_encoding['br']:
+        response.set_data(brotli.compress(data, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif accept_encoding['gzip']:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        return response
+    response.vary.add('Accept-Encoding')
+    return response
+
+# 监控指标：进程内注册表，按Prometheus文本格式输出，不依赖prometheus_client。
+# 计数只在当前进程内累加，多worker部署时每个worker分别统计，由Prometheus按实例抓取后汇总
+def format_metric_labels(names, values):
+    if not names:
+        return ''
+    escaped = [str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values]
+    return '{%s}' % ','.join('%s="%s"' % (n, v) for n, v in zip(names, escaped))
+
+def format_metric_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class MetricCounter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labelvalues, value in values:
+            yield self.name, self.labelnames, labelvalues, value
+
+class MetricHistogram:
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values = {}  # 标签值 -> [各桶计数..., 总和]，桶计数不累加，输出时再求前缀和
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            counts = self._values.get(labelvalues)
+            if counts is None:
+                counts = self._values[labelvalues] = [0] * len(self.buckets) + [0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = sorted((k, list(v)) for k, v in self._values.items())
+        bucket_labels = self.labelnames + ('le',)
+        for labelvalues, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield self.name + '_bucket', bucket_labels, labelvalues + (format_metric_value(bound),), cumulative
+            yield self.name + '_sum', self.labelnames, labelvalues, counts[-1]
+            yield self.name + '_count', self.labelnames, labelvalues, cumulative
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.documentation))
+            lines.append('# TYPE %s %s' % (metric.name, metric.type))
+            for name, labelnames, labelvalues, value in metric.samples():
+                lines.append('%s%s %s' % (name, format_metric_labels(labelnames, labelvalues), format_metric_value(value)))
+        return '\n'.join(lines) + '\n'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+metrics_registry = MetricsRegistry()
+HTTP_REQUESTS = metrics_registry.register(MetricCounter(
+    'http_requests_total', '按接口、方法、HTTP状态码和响应体code统计的请求数', ('endpoint', 'method', 'status', 'code')))
+HTTP_REQUEST_DURATION = metrics_registry.register(MetricHistogram(
+    'http_request_duration_seconds', '请求处理耗时（流式响应计到输出结束）', ('endpoint', 'method'), LATENCY_BUCKETS))
+HTTP_REQUEST_SQL_QUERIES = metrics_registry.register(MetricHistogram(
+    'http_request_sql_queries', '每个请求执行的SQL语句数', ('endpoint',), (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)))
+HTTP_REQUEST_SQL_DURATION = metrics_registry.register(MetricHistogram(
+    'http_request_sql_duration_seconds', '每个请求执行SQL的总耗时', ('endpoint',), LATENCY_BUCKETS))
+HTTP_RESPONSE_SIZE = metrics_registry.register(MetricHistogram(
+    'http_response_size_bytes', '响应体大小（压缩后；没有Content-Length的流式响应不统计）', ('endpoint',),
+    (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)))
+JWT_VERIFY_DURATION = metrics_registry.register(MetricHistogram(
+    'jwt_verify_duration_seconds', 'JWT解码与校验耗时', (), (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)))
+PASSWORD_HASH_DURATION = metrics_registry.register(MetricHistogram(
+    'password_hash_duration_seconds', '密码哈希耗时（含排队），operation为hash或verify', ('operation',), LATENCY_BUCKETS))
+
+# 不计入指标的接口：指标抓取本身，以及长连接的事件推送
+METRICS_EXCLUDED_ENDPOINTS = {'api.metrics', 'api.stream_order_events'}
+RESPONSE_CODE_PATTERN = re.compile(rb'^\{\s*"code":\s*(\d+)')
+
+# SQL计数与耗时：监听所有引擎（含只读引擎），只累计请求上下文中执行的语句，后台线程的查询不计入
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and has_request_context() and 'request_metrics' in g:
+        context._metrics_query_start = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_metrics_query_start', None)
+    if start is not None and has_request_context() and 'request_metrics' in g:
+        g.request_metrics['sql_queries'] += 1
+        g.request_metrics['sql_seconds'] += time.perf_counter() - start
+
+# JWT耗时：flask_jwt_extended在解码前取密钥、解码并校验过期等之后执行自定义校验，用这两个回调计时
+@jwt.decode_key_loader
+def jwt_decode_key(jwt_header, jwt_data):
+    g.jwt_verify_start = time.perf_counter()
+    return default_decode_key_callback(jwt_header, jwt_data)
+
+@jwt.token_verification_loader
+def jwt_verified(jwt_header, jwt_data):
+    start = g.pop('jwt_verify_start', None)
+    if start is not None:
+        JWT_VERIFY_DURATION.observe(time.perf_counter() - start)
+    return True
+
+# 请求剖析：sample模式由采样线程定时读取请求线程的调用栈，按折叠栈格式（“帧;帧;帧 次数”）计数，
+# 可直接交给flamegraph.pl或speedscope生成火焰图。只剖析处理请求的线程，哈希线程池中的计算显示为等待
+PROFILE_MODES = ('sample', 'cprofile', 'pyinstrument')
+
+class StackSampler:
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write('%s %d\n' % (stack, count))
+
+class RequestProfiler:
+    EXTENSIONS = {'sample': 'folded', 'cprofile': 'prof', 'pyinstrument': 'speedscope.json'}
+
+    def __init__(self, mode, interval):
+        if mode == 'pyinstrument' and pyinstrument is None:
+            mode = 'sample'
+        self.mode = mode
+        if mode == 'cprofile':
+            self._profiler = cProfile.Profile()
+        elif mode == 'pyinstrument':
+            self._profiler = pyinstrument.Profiler(interval=interval, async_mode='disabled')
+        else:
+            self._profiler = StackSampler(threading.get_ident(), interval)
+
+    def start(self):
+        if self.mode == 'cprofile':
+            self._profiler.enable()
+        else:
+            self._profiler.start()
+
+    def stop(self):
+        if self.mode == 'cprofile':
+            self._profiler.disable()
+        else:
+            self._profiler.stop()
+
+    def dump(self, directory, name):
+        """写入剖析结果，返回文件名"""
+        os.makedirs(directory, exist_ok=True)
+        filename = '%s.%s' % (name, self.EXTENSIONS[self.mode])
+        path = os.path.join(directory, filename)
+        if self.mode == 'cprofile':
+            self._profiler.dump_stats(path)
+        elif self.mode == 'pyinstrument':
+            from pyinstrument.renderers import SpeedscopeRenderer
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self._profiler.output(SpeedscopeRenderer()))
+        else:
+            self._profiler.dump(path)
+        return filename
+
+def requested_profile_mode():
+    config = current_app.config
+    value = request.headers.get('X-Profile')
+    if not config['PROFILE_ENABLED'] or not value:
+        return None
+    if config['PROFILE_TOKEN']:
+        return config['PROFILE_MODE'] if hmac.compare_digest(value, config['PROFILE_TOKEN']) else None
+    return value if value in PROFILE_MODES else config['PROFILE_MODE']
+
+@bp.before_app_request
+def start_request_metrics():
+    if not current_app.config['METRICS_ENABLED'] and not current_app.config['PROFILE_ENABLED']:
+        return
+    g.request_metrics = {'start': time.perf_counter(), 'sql_queries': 0, 'sql_seconds': 0.0}
+    mode = requested_profile_mode()
+    if mode:
+        profiler = RequestProfiler(mode, current_app.config['PROFILE_INTERVAL'])
+        try:
+            profiler.start()
+        except ValueError:
+            return  # 同一解释器中已有其他剖析器在运行（Python 3.12起cProfile全局只能启用一个）
+        g.request_profiler = profiler
+
+# 在压缩之前执行（after_request按注册的相反顺序调用），可以从未压缩的响应体中读出业务code。
+# 耗时、SQL和响应大小在响应输出结束后记录，流式导出也计入完整的输出时间
+@bp.after_app_request
+def record_request_metrics(response):
+    metrics = g.get('request_metrics')
+    if metrics is None:
+        return response
+    profiler = g.pop('request_profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        elapsed_ms = (time.perf_counter() - metrics['start']) * 1000
+        if elapsed_ms >= current_app.config['PROFILE_SLOW_MS']:
+            name = '%s-%s-%dms' % (datetime.now().strftime('%Y%m%d-%H%M%S-%f'), request.endpoint or 'unmatched', elapsed_ms)
+            response.headers['X-Profile-File'] = profiler.dump(current_app.config['PROFILE_DIR'], name)
+    endpoint = request.endpoint or 'unmatched'
+    if not current_app.config['METRICS_ENABLED'] or endpoint in METRICS_EXCLUDED_ENDPOINTS:
+        return response
+    code = ''
+    if not response.is_streamed and response.mimetype == 'application/json':
+        match = RESPONSE_CODE_PATTERN.match(response.get_data()[:32])
+        if match:
+            code = match.group(1).decode()
+    method, status = request.method, str(response.status_code)
+
+    def record():
+        HTTP_REQUESTS.inc(endpoint, method, status, code)
+        HTTP_REQUEST_DURATION.observe(time.perf_counter() - metrics['start'], endpoint, method)
+        HTTP_REQUEST_SQL_QUERIES.observe(metrics['sql_queries'], endpoint)
+        HTTP_REQUEST_SQL_DURATION.observe(metrics['sql_seconds'], endpoint)
+        if response.content_length is not None:
+            HTTP_RESPONSE_SIZE.observe(response.content_length, endpoint)
+    response.call_on_close(record)
+    return response
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    if not current_app.config['METRICS_ENABLED']:
+        return jsonify({'code': 404, 'msg': '未开启监控指标'})
+    token = current_app.config['METRICS_TOKEN']
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer ' + token):
+        response = jsonify({'code': 401, 'msg': '无权访问'})
+        response.status_code = 401
+        return response
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
 # 认证相关API
-@app.route('/api/auth/login', methods=['POST'])
+@bp.route('/api/auth/login', methods=['POST'])
 def login():
     data = request.json
     username = data.get('username')
     password = data.get('password')
+    if not username or not password:
+        return jsonify({'code': 400, 'msg': '请输入用户名和密码'})
     
-    user = User.query.filter_by(username=username).first()
-    if not user:
-        return jsonify({'code': 404, 'msg': '用户不存在'})
+    # 在计算哈希之前按IP和用户名两个维度限流
+    check_rate_limit('login-ip', request.remote_addr, 'RATELIMIT_LOGIN_IP')
+    check_rate_limit('login-user', username, 'RATELIMIT_LOGIN_USER')
     
-    from werkzeug.security import check_password_hash
-    if not check_password_hash(user.password, password):
-        return jsonify({'code': 401, 'msg': '密码错误'})
+    # 用户不存在时也校验一次哈希并返回相同提示，避免通过响应内容或耗时枚举用户名
+    user = User.query.filter_by(username=username).first()
+    password_hash = user.password if user else get_dummy_password_hash()
+    if not verify_password(password_hash, password) or not user:
+        return jsonify({'code': 401, 'msg': '用户名或密码错误'})
+    reset_rate_limit('login-user', username)
+    
+    # 旧参数生成的哈希在登录成功时按当前参数重新计算
+    if password_needs_rehash(user.password):
+        password_hash = hash_password(password)
+        begin_write_transaction()
+        user = db.session.get(User, user.id)
+        user.password = password_hash
+        db.session.commit()
     
     # 创建JWT Token
-    access_token = create_access_token(identity=str(user.id))
+    access_token = create_access_token(identity=str(user.id), additional_claims=user_claims(user))
     
     # 返回用户信息和Token
     return jsonify({
@@ -172,18 +2288,16 @@ def login():
     })
 
 # 获取当前用户信息
-@app.route('/api/auth/me', methods=['GET'])
+@bp.route('/api/auth/me', methods=['GET'])
 @jwt_required()
 def get_current_user():
     current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
-    if not user:
-        return jsonify({'code': 404, 'msg': '用户不存在'})
     
-    return jsonify({
-        'code': 200,
-        'msg': '获取成功',
-        'data': {
+    def load():
+        user = db.session.get(User, current_user_id)
+        if not user:
+            return None
+        return {
             'id': user.id,
             'username': user.username,
             'name': user.name,
@@ -192,34 +2306,53 @@ def get_current_user():
             'email': user.email,
             'avatar': user.avatar
         }
+    
+    user_info = user_cache.get_or_load(current_user_id, load)
+    if not user_info:
+        return jsonify({'code': 404, 'msg': '用户不存在'})
+    
+    return jsonify({
+        'code': 200,
+        'msg': '获取成功',
+        'data': user_info
     })
 
 # 修改密码
-@app.route('/api/auth/change-password', methods=['POST'])
+@bp.route('/api/auth/change-password', methods=['POST'])
 @jwt_required()
+@rate_limit('RATELIMIT_WRITE')
 def change_password():
     data = request.json
     current_password = data.get('current_password')
     new_password = data.get('new_password')
     
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    current_user_id = int(get_jwt_identity())
+    user = db.session.get(User, current_user_id)
+    if not user:
+        return jsonify({'code': 404, 'msg': '用户不存在'})
     
-    from werkzeug.security import check_password_hash, generate_password_hash
-    if not check_password_hash(user.password, current_password):
+    if not verify_password(user.password, current_password):
         return jsonify({'code': 401, 'msg': '原密码错误'})
     
-    user.password = generate_password_hash(new_password)
+    password_hash = hash_password(new_password)
+    begin_write_transaction()
+    user = db.session.get(User, current_user_id)
+    if not user:
+        return jsonify({'code': 404, 'msg': '用户不存在'})
+    user.password = password_hash
     db.session.commit()
     
     return jsonify({'code': 200, 'msg': '密码修改成功'})
 
 # 更新个人信息
-@app.route('/api/profile', methods=['PUT'])
+@bp.route('/api/profile', methods=['PUT'])
 @jwt_required()
+@rate_limit('RATELIMIT_WRITE')
 def update_profile():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    current_user_id = int(get_jwt_identity())
+    user = db.session.get(User, current_user_id)
+    if not user:
+        return jsonify({'code': 404, 'msg': '用户不存在'})
     
     data = request.json
     
@@ -235,6 +2368,7 @@ def update_profile():
     
     try:
         db.session.commit()
+        invalidate_user_caches(current_user_id)
         return jsonify({
             'code': 200,
             'msg': '个人信息更新成功',
@@ -253,14 +2387,11 @@ def update_profile():
         return jsonify({'code': 500, 'msg': '更新失败', 'error': str(e)})
 
 # 报修相关API
-@app.route('/api/repairs', methods=['POST'])
-@jwt_required()
+@bp.route('/api/repairs', methods=['POST'])
+@role_required('student', msg='只有学生可以提交报修')
+@rate_limit('RATELIMIT_WRITE')
 def create_repair_order():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if user.role != 'student':
-        return jsonify({'code': 403, 'msg': '只有学生可以提交报修'})
+    current_user_id = g.user_id
     
     data = request.json
     category_id = data.get('category')
@@ -273,22 +2404,44 @@ def create_repair_order():
     if not all([category_id, room, description]):
         return jsonify({'code': 400, 'msg': '请填写完整的报修信息'})
     
+    try:
+        category_id = int(category_id)
+    except (TypeError, ValueError):
+        category_id = None
+    if category_id not in get_category_map():
+        return jsonify({'code': 400, 'msg': '故障类型不存在'})
+    
+    # 图片必须先通过上传接口保存
+    if not isinstance(images, list) or not all(isinstance(image_path, str) for image_path in images) \
+            or not all(is_stored_image(image_path) for image_path in images):
+        return jsonify({'code': 400, 'msg': '图片无效，请重新上传'})
+    
     try:
         # 转换预约时间
         if appointment_time:
             appointment_time = datetime.strptime(appointment_time, '%Y-%m-%d %H:%M')
         
+        # 与近期同楼栋同分类的报修单描述相似时合并，状态和维修人员跟随主报修单
+        building = parse_building(room)
+        parent = None
+        if current_app.config['DUPLICATE_DETECTION']:
+            parent = find_duplicate_parent(category_id, room, building, description)
+        
         # 创建报修单
         repair_order = RepairOrder(
             student_id=current_user_id,
             category_id=category_id,
             room=room,
+            building=building,
             description=description,
             appointment_time=appointment_time,
-            status='pending'
+            status=parent.status if parent else 'pending',
+            repairman_id=parent.repairman_id if parent else None,
+            parent_id=parent.id if parent else None
         )
         db.session.add(repair_order)
         db.session.flush()  # 获取repair_order.id
+        rollup_order_created(repair_order)
         
         # 保存图片信息
         for image_path in images:
@@ -298,29 +2451,200 @@ def create_repair_order():
             )
             db.session.add(repair_image)
         
+        queue_order_event('created', repair_order)
         db.session.commit()
         
-        return jsonify({'code': 200, 'msg': '报修提交成功', 'data': {'repair_order_id': repair_order.id}})
+        msg = '报修提交成功，已有同楼栋的相同报修（#%d），将一并处理' % parent.id if parent else '报修提交成功'
+        return jsonify({'code': 200, 'msg': msg, 'data': {'repair_order_id': repair_order.id,
+                                                         'parent_id': repair_order.parent_id}})
     except Exception as e:
         db.session.rollback()
         return jsonify({'code': 500, 'msg': '提交失败', 'error': str(e)})
 
-# 获取用户的报修单列表
-@app.route('/api/repairs', methods=['GET'])
+# 上传报修图片
+@bp.route('/api/uploads/images', methods=['POST'])
 @jwt_required()
+@rate_limit('RATELIMIT_UPLOAD')
+def upload_image():
+    file = request.files.get('file')
+    if not file:
+        return jsonify({'code': 400, 'msg': '请选择要上传的图片'})
+    
+    try:
+        image_path = store_image(file.read())
+    except Exception as e:
+        return jsonify({'code': 400, 'msg': '图片格式不支持', 'error': str(e)})
+    
+    return jsonify({'code': 200, 'msg': '上传成功', 'data': {
+        'path': image_path,
+        'url': upload_url(image_path),
+        'thumb_url': upload_url(thumb_path(image_path))
+    }})
+
+# 静态文件：支持ETag/Last-Modified条件请求(304)和Range请求(206)，
+# 文件体由WSGI服务器的file_wrapper（sendfile）或X-Sendfile发送，不经过Python读写
+CONTENT_ADDRESSED_RE = re.compile(r'^(?:images|thumbs)/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})\.jpg$')
+
+def send_cached_file(directory, filename, max_age=0, etag=True, immutable=False):
+    response = send_from_directory(directory, filename, conditional=True, etag=etag, max_age=max_age)
+    response.cache_control.public = True
+    if immutable:
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True  # 每次使用前用ETag校验，未变化时返回304
+    return response
+
+@bp.route('/uploads/<path:filename>', methods=['GET'])
+def get_upload(filename):
+    match = CONTENT_ADDRESSED_RE.match(filename)
+    if match:
+        # 文件名即内容摘要，内容永不改变，可长期缓存
+        return send_cached_file(current_app.config['UPLOAD_FOLDER'], filename,
+                                max_age=365 * 24 * 3600, etag=match.group(1), immutable=True)
+    return send_cached_file(current_app.config['UPLOAD_FOLDER'], filename)
+
+@bp.route('/', methods=['GET'])
+@bp.route('/index.html', methods=['GET'])
+def get_index():
+    return send_cached_file(current_app.config['FRONTEND_FOLDER'], 'index.html')
+
+def order_list_item(order):
+    return {
+        'id': order.id,
+        'room': order.room,
+        'description': order.description,
+        'category': order.category.name if order.category else '',
+        'status': order.status,
+        'created_at': order.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'updated_at': order.updated_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'student_name': order.student.name if order.student else '',
+        'repairman_name': order.repairman.name if order.repairman else '',
+        'images': [img.image_path for img in order.images],
+        'thumbnails': [upload_url(thumb_path(img.image_path)) for img in order.images],
+        'parent_id': order.parent_id
+    }
+
+# 一页报修单中每条主报修单合并了多少条重复报修
+def duplicate_counts(orders, model=RepairOrder):
+    if not orders:
+        return {}
+    return dict(db.session.query(model.parent_id, func.count(model.id)).filter(
+        model.parent_id.in_([order.id for order in orders])).group_by(model.parent_id))
+
+def order_event_item(order_event):
+    return {
+        'id': order_event.id,
+        'order_id': order_event.order_id,
+        'type': order_event.type,
+        'status': order_event.status,
+        'repairman_id': order_event.repairman_id,
+        'time': order_event.created_at.strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+# 获取用户的报修单列表
+@bp.route('/api/repairs', methods=['GET'])
+@role_required()
+@conditional_json('repair_order', 'repair_image', 'repair_order_archive', 'repair_image_archive', 'user', 'category',
+                  'comment', 'order_event')
 def get_repair_orders():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    current_user_id = g.user_id
+    
+    # archived=1时查询已归档的报修单，分页和筛选参数相同
+    model = ArchivedRepairOrder if request.args.get('archived') in ('1', 'true') else RepairOrder
+    query = repair_order_query(model)
+    if g.role == 'student':
+        query = query.filter_by(student_id=current_user_id)
+    elif g.role == 'repairman':
+        query = query.filter_by(repairman_id=current_user_id)
+    
+    # 先取同步游标再查列表，列表之后发生的变化都能通过增量接口拿到
+    changes_cursor = db.session.query(func.max(OrderEvent.id)).scalar() or 0
+    try:
+        orders, page = paginate_repair_orders(query, request.args, model=model)
+    except ValueError as e:
+        return jsonify({'code': 400, 'msg': str(e)})
+    
+    counts = duplicate_counts(orders, model)
+    result = [dict(order_list_item(order), duplicate_count=counts.get(order.id, 0)) for order in orders]
+    return jsonify({'code': 200, 'msg': '获取成功', 'data': dict(page, items=result, changes_cursor=changes_cursor)})
+
+# 增量同步：返回since游标之后当前用户可见的事件，以及涉及报修单的最新数据（与列表项格式相同）。
+# 客户端先拉取列表并保存列表返回的changes_cursor，之后用游标拉取变化并按id合并
+CHANGES_MAX_LIMIT = 500
+CHANGES_SETTLE_SECONDS = 2  # 非SQLite数据库中并发事务可能乱序提交，最近几秒的事件留到下次返回
+
+@bp.route('/api/repairs/changes', methods=['GET'])
+@role_required()
+def get_repair_changes():
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({'code': 400, 'msg': '缺少since参数'})
+    limit = min(max(request.args.get('limit', 200, type=int), 1), CHANGES_MAX_LIMIT)
+    
+    query = OrderEvent.query.filter(OrderEvent.id > since)
+    if g.role == 'student':
+        query = query.filter(OrderEvent.student_id == g.user_id)
+    elif g.role == 'repairman':
+        query = query.filter(or_(OrderEvent.repairman_id == g.user_id,
+                                 OrderEvent.type.in_(('approved', 'accepted', 'assigned'))))
+    if db.engine.dialect.name != 'sqlite':
+        query = query.filter(OrderEvent.created_at <= datetime.now() - timedelta(seconds=CHANGES_SETTLE_SECONDS))
+    events = query.order_by(OrderEvent.id).limit(limit + 1).all()
+    has_more = len(events) > limit
+    events = events[:limit]
+    
+    order_ids = list(dict.fromkeys(e.order_id for e in events))
+    orders = repair_order_query().filter(RepairOrder.id.in_(order_ids)).all() if order_ids else []
+    return jsonify({'code': 200, 'msg': '获取成功', 'data': {
+        'events': [order_event_item(e) for e in events],
+        'orders': [order_list_item(order) for order in orders],
+        'cursor': events[-1].id if events else since,
+        'has_more': has_more
+    }})
+
+# 报修单的完整事件记录（审计），权限与详情相同
+@bp.route('/api/repairs/<int:order_id>/events', methods=['GET'])
+@role_required()
+def get_repair_order_events(order_id):
+    order = db.session.get(RepairOrder, order_id) or db.session.get(ArchivedRepairOrder, order_id)
+    if not order:
+        return jsonify({'code': 404, 'msg': '报修单不存在'})
+    if g.role == 'student' and order.student_id != g.user_id:
+        return jsonify({'code': 403, 'msg': '无权查看该报修单'})
+    events = OrderEvent.query.filter_by(order_id=order_id).order_by(OrderEvent.id).all()
+    actors = dict(db.session.query(User.id, User.name).filter(User.id.in_({e.actor_id for e in events if e.actor_id})))
+    return jsonify({'code': 200, 'msg': '获取成功', 'data': [
+        dict(order_event_item(e), actor_name=actors.get(e.actor_id, '系统') if e.actor_id else '系统') for e in events]})
+
+# 全文检索报修单（管理员），按相关度排序，支持与列表相同的状态/分类/日期筛选
+@bp.route('/api/repairs/search', methods=['GET'])
+@role_required('admin')
+@conditional_json('repair_order', 'repair_image', 'repair_order_archive', 'repair_image_archive', 'user', 'category')
+def search_repairs():
+    terms = parse_search_terms(request.args.get('q'))
+    if not terms:
+        return jsonify({'code': 400, 'msg': '请输入检索词'})
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    offset = max(request.args.get('offset', 0, type=int), 0)
     
-    if user.role == 'student':
-        orders = RepairOrder.query.filter_by(student_id=current_user_id).all()
-    elif user.role == 'repairman':
-        orders = RepairOrder.query.filter_by(repairman_id=current_user_id).all()
-    else:  # admin
-        orders = RepairOrder.query.all()
+    try:
+        queries = [search_repair_orders(apply_repair_filters(repair_order_query(model), request.args, model), terms, model)
+                   for model in (RepairOrder, ArchivedRepairOrder)]
+    except ValueError as e:
+        return jsonify({'code': 400, 'msg': str(e)})
+    
+    # 当前报修单在前、归档单在后，各自按相关度排序；多取一条用于判断是否还有下一页
+    hot_query, archive_query = queries
+    orders = hot_query.offset(offset).limit(limit + 1).all()
+    if len(orders) <= limit:
+        hot_total = offset + len(orders) if orders or not offset else hot_query.order_by(None).count()
+        orders += archive_query.offset(max(offset - hot_total, 0)).limit(limit + 1 - len(orders)).all()
+    has_more = len(orders) > limit
+    orders = orders[:limit]
     
     result = []
     for order in orders:
+        student_name = order.student.name if order.student else ''
         result.append({
             'id': order.id,
             'room': order.room,
@@ -328,32 +2652,46 @@ def get_repair_orders():
             'category': order.category.name if order.category else '',
             'status': order.status,
             'created_at': order.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'updated_at': order.updated_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'student_name': order.student.name if order.student else '',
+            'student_name': student_name,
             'repairman_name': order.repairman.name if order.repairman else '',
-            'images': [img.image_path for img in order.images]
+            'thumbnails': [upload_url(thumb_path(img.image_path)) for img in order.images],
+            'archived': isinstance(order, ArchivedRepairOrder),
+            'highlight': {
+                'room': highlight_terms(order.room, terms),
+                'description': highlight_terms(order.description, terms),
+                'student_name': highlight_terms(student_name, terms)
+            }
         })
     
-    return jsonify({'code': 200, 'msg': '获取成功', 'data': result})
+    return jsonify({'code': 200, 'msg': '获取成功', 'data': {
+        'items': result,
+        'terms': terms,
+        'next_offset': offset + limit if has_more else None,
+        'has_more': has_more
+    }})
 
 # 获取单个报修单详情
-@app.route('/api/repairs/<int:order_id>', methods=['GET'])
-@jwt_required()
+@bp.route('/api/repairs/<int:order_id>', methods=['GET'])
+@role_required()
+@conditional_json('repair_order', 'repair_image', 'comment', 'repair_order_archive', 'repair_image_archive',
+                  'comment_archive', 'user', 'category')
 def get_repair_order_detail(order_id):
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    current_user_id = g.user_id
     
-    # 获取报修单
-    order = RepairOrder.query.get(order_id)
+    # 获取报修单（连同评论一起批量加载），热表中没有时查归档表
+    for model in (RepairOrder, ArchivedRepairOrder):
+        order = repair_order_query(model).options(selectinload(model.comment)).filter_by(id=order_id).first()
+        if order:
+            break
     if not order:
         return jsonify({'code': 404, 'msg': '报修单不存在'})
     
     # 检查权限：学生只能查看自己的报修单，管理员和维修人员可以查看所有
-    if user.role == 'student' and order.student_id != current_user_id:
+    if g.role == 'student' and order.student_id != current_user_id:
         return jsonify({'code': 403, 'msg': '无权查看该报修单'})
     
     # 获取评论
-    comment = Comment.query.filter_by(repair_order_id=order_id).first()
+    comment = order.comment[0] if order.comment else None
     comment_info = None
     if comment:
         comment_info = {
@@ -379,21 +2717,21 @@ def get_repair_order_detail(order_id):
         'repairman_id': order.repairman_id,
         'repairman_name': order.repairman.name if order.repairman else '',
         'images': [img.image_path for img in order.images],
-        'comment': comment_info
+        'image_urls': [upload_url(img.image_path) for img in order.images],
+        'thumbnails': [upload_url(thumb_path(img.image_path)) for img in order.images],
+        'comment': comment_info,
+        'archived': isinstance(order, ArchivedRepairOrder),
+        'parent_id': order.parent_id,
+        'duplicate_ids': [order_id for order_id, in db.session.query(model.id).filter(model.parent_id == order.id)
+                          .order_by(model.id)]
     }
     
     return jsonify({'code': 200, 'msg': '获取成功', 'data': result})
 
 # 用户管理API
-@app.route('/api/users', methods=['GET'])
-@jwt_required()
+@bp.route('/api/users', methods=['GET'])
+@role_required('admin', msg='只有管理员可以访问此功能')
 def get_users():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if user.role != 'admin':
-        return jsonify({'code': 403, 'msg': '只有管理员可以访问此功能'})
-    
     users = User.query.all()
     result = []
     for u in users:
@@ -410,15 +2748,9 @@ def get_users():
     
     return jsonify({'code': 200, 'msg': '获取成功', 'data': result})
 
-@app.route('/api/users', methods=['POST'])
-@jwt_required()
+@bp.route('/api/users', methods=['POST'])
+@role_required('admin', msg='只有管理员可以访问此功能')
 def create_user():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if user.role != 'admin':
-        return jsonify({'code': 403, 'msg': '只有管理员可以访问此功能'})
-    
     data = request.json
     username = data.get('username')
     password = data.get('password')
@@ -435,10 +2767,12 @@ def create_user():
     if User.query.filter_by(username=username).first():
         return jsonify({'code': 400, 'msg': '用户名已存在'})
     
-    from werkzeug.security import generate_password_hash
+    # 哈希在事务外计算，期间其他请求创建的同名用户由唯一约束拦截
+    password_hash = hash_password(password)
+    begin_write_transaction()
     new_user = User(
         username=username,
-        password=generate_password_hash(password),
+        password=password_hash,
         name=name,
         role=role,
         phone=phone,
@@ -448,26 +2782,192 @@ def create_user():
     try:
         db.session.add(new_user)
         db.session.commit()
+        invalidate_user_caches(new_user.id)
         return jsonify({'code': 200, 'msg': '用户创建成功', 'data': {'user_id': new_user.id}})
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'code': 400, 'msg': '用户名已存在'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'code': 500, 'msg': '创建失败', 'error': str(e)})
 
-@app.route('/api/users/<int:user_id>', methods=['PUT'])
-@jwt_required()
-def update_user(user_id):
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+# 批量导入用户（xlsx/csv），密码哈希在进程池中并行计算，逐批写入并流式返回逐行结果
+IMPORT_COLUMNS = {
+    'username': ('username', '账号', '学号', '工号'),
+    'password': ('password', '密码'),
+    'name': ('name', '姓名'),
+    'role': ('role', '角色'),
+    'phone': ('phone', '手机号', '电话'),
+    'email': ('email', '邮箱'),
+}
+IMPORT_ROLES = {'student': 'student', 'repairman': 'repairman', 'admin': 'admin',
+                '学生': 'student', '维修人员': 'repairman', '管理员': 'admin'}
+IMPORT_BATCH_SIZE = 500
+# 导入用的进程池绕过了BoundedHashExecutor的排队上限和503，进程数同样按HASH_WORKERS限制；
+# 导入只对管理员开放，且每批哈希计算期间不持有数据库事务
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+
+def get_hash_pool():
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            _hash_pool = ProcessPoolExecutor(max_workers=current_app.config['HASH_WORKERS'])
+        return _hash_pool
+
+def read_import_file(file):
+    import pandas as pd
+    
+    filename = (file.filename or '').lower()
+    if filename.endswith(('.xlsx', '.xls')):
+        frame = pd.read_excel(file, dtype=str, keep_default_na=False)
+    elif filename.endswith('.csv'):
+        content = file.read()
+        try:
+            text = content.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            text = content.decode('gbk')  # Excel另存的中文CSV
+        frame = pd.read_csv(io.StringIO(text), dtype=str, keep_default_na=False)
+    else:
+        raise ValueError('仅支持xlsx或csv文件')
+    
+    columns = {}
+    for field, aliases in IMPORT_COLUMNS.items():
+        for header in frame.columns:
+            if str(header).strip().lower() in aliases:
+                columns[field] = header
+                break
+    missing = [field for field in ('username', 'password', 'name', 'role') if field not in columns]
+    if missing:
+        raise ValueError('缺少必填列：%s' % '、'.join(missing))
+    
+    positions = {field: frame.columns.get_loc(column) for field, column in columns.items()}
+    for line_no, row in enumerate(frame.itertuples(index=False, name=None), 2):  # 第1行是表头
+        yield line_no, {field: str(row[position]).strip() for field, position in positions.items()}
+
+def import_user_batch(batch, seen_usernames):
+    """校验并写入一批用户，返回[(行号, 账号, 是否成功, 说明)]"""
+    results, valid = [], []
+    usernames = [record['username'] for _, record in batch if record['username']]
+    existing = {row[0] for row in db.session.query(User.username).filter(User.username.in_(usernames))}
+    for line_no, record in batch:
+        username = record['username']
+        role = IMPORT_ROLES.get(record['role'])
+        if not all([username, record['password'], record['name']]):
+            results.append((line_no, username, False, '账号、密码、姓名不能为空'))
+        elif role is None:
+            results.append((line_no, username, False, '角色无效'))
+        elif username in existing:
+            results.append((line_no, username, False, '用户名已存在'))
+        elif username in seen_usernames:
+            results.append((line_no, username, False, '文件中用户名重复'))
+        else:
+            seen_usernames.add(username)
+            valid.append((line_no, dict(record, role=role)))
+    
+    # 先结束查询用户名时开启的事务：SQLite写请求的事务持有写锁，不能在计算哈希期间一直占用
+    db.session.rollback()
+    if not valid:
+        return sorted(results)
+    
+    hash_fn = functools.partial(generate_password_hash, method=current_app.config['PASSWORD_HASH_METHOD'])
+    hashes = get_hash_pool().map(hash_fn, [record['password'] for _, record in valid],
+                                 chunksize=max(len(valid) // (current_app.config['HASH_WORKERS'] * 4), 1))
+    rows = [{
+        'username': record['username'],
+        'password': password_hash,
+        'name': record['name'],
+        'role': record['role'],
+        'phone': record.get('phone') or None,
+        'email': record.get('email') or None
+    } for (_, record), password_hash in zip(valid, hashes)]
+    # 写入是一个短事务；计算哈希期间其他请求可能创建了同名用户，唯一约束冲突时剔除已存在的用户名再写一次
+    taken, error = set(), None
+    for attempt in range(2):
+        pending = [row for row in rows if row['username'] not in taken]
+        if not pending:
+            break
+        begin_write_transaction()
+        try:
+            db.session.execute(insert(User), pending)
+            db.session.commit()
+            break
+        except IntegrityError as e:
+            db.session.rollback()
+            conflicts = {row[0] for row in db.session.query(User.username).filter(
+                User.username.in_([row['username'] for row in pending]))}
+            db.session.rollback()
+            if attempt or not conflicts:
+                error = '写入失败：%s' % e.orig
+                break
+            taken |= conflicts
+        except Exception as e:
+            db.session.rollback()
+            error = '写入失败：%s' % e
+            break
+    for line_no, record in valid:
+        if record['username'] in taken:
+            results.append((line_no, record['username'], False, '用户名已存在'))
+        elif error:
+            results.append((line_no, record['username'], False, error))
+        else:
+            results.append((line_no, record['username'], True, '导入成功'))
+    return sorted(results)
+
+@bp.route('/api/users/import', methods=['POST'])
+@role_required('admin', msg='只有管理员可以访问此功能')
+def import_users():
+    file = request.files.get('file')
+    if not file:
+        return jsonify({'code': 400, 'msg': '请选择要导入的文件'})
     
-    if user.role != 'admin':
-        return jsonify({'code': 403, 'msg': '只有管理员可以访问此功能'})
+    try:
+        records = read_import_file(file)
+        first = next(records, None)  # 提前解析表头，格式错误时直接返回JSON
+    except ValueError as e:
+        return jsonify({'code': 400, 'msg': str(e)})
+    except Exception as e:
+        return jsonify({'code': 400, 'msg': '文件解析失败', 'error': str(e)})
+    
+    def generate():
+        succeeded = failed = 0
+        seen_usernames = set()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        buffer.write('\ufeff')
+        writer.writerow(['行号', '账号', '结果', '说明'])
+        all_records = itertools.chain([first], records) if first else records
+        while True:
+            batch = list(itertools.islice(all_records, IMPORT_BATCH_SIZE))
+            if not batch:
+                break
+            for line_no, username, ok, msg in import_user_batch(batch, seen_usernames):
+                writer.writerow([line_no, username, '成功' if ok else '失败', msg])
+                succeeded, failed = succeeded + ok, failed + (not ok)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        user_cache.invalidate()
+        user_role_cache.invalidate()
+        writer.writerow(['合计', '', '成功%d条' % succeeded, '失败%d条' % failed])
+        yield buffer.getvalue()
+    
+    return Response(stream_with_context(generate()), mimetype='text/csv; charset=utf-8', headers={
+        'Content-Disposition': 'attachment; filename=%s' % report_filename('csv', prefix='import_result')
+    })
+
+@bp.route('/api/users/<int:user_id>', methods=['PUT'])
+@role_required('admin', msg='只有管理员可以访问此功能')
+def update_user(user_id):
+    data = request.json
+    # 新密码的哈希在事务外计算
+    password_hash = hash_password(data['password']) if data.get('password') else None
     
-    update_user = User.query.get(user_id)
+    begin_write_transaction()
+    update_user = db.session.get(User, user_id)
     if not update_user:
         return jsonify({'code': 404, 'msg': '用户不存在'})
     
-    data = request.json
-    
     # 更新用户信息
     if 'name' in data:
         update_user.name = data['name']
@@ -477,26 +2977,20 @@ def update_user(user_id):
         update_user.phone = data['phone']
     if 'email' in data:
         update_user.email = data['email']
-    if 'password' in data and data['password']:
-        from werkzeug.security import generate_password_hash
-        update_user.password = generate_password_hash(data['password'])
+    if password_hash:
+        update_user.password = password_hash
     
     try:
         db.session.commit()
+        invalidate_user_caches(user_id)
         return jsonify({'code': 200, 'msg': '用户更新成功'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'code': 500, 'msg': '更新失败', 'error': str(e)})
 
-@app.route('/api/users/<int:user_id>', methods=['DELETE'])
-@jwt_required()
+@bp.route('/api/users/<int:user_id>', methods=['DELETE'])
+@role_required('admin', msg='只有管理员可以访问此功能')
 def delete_user(user_id):
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if user.role != 'admin':
-        return jsonify({'code': 403, 'msg': '只有管理员可以访问此功能'})
-    
     delete_user = User.query.get(user_id)
     if not delete_user:
         return jsonify({'code': 404, 'msg': '用户不存在'})
@@ -504,70 +2998,219 @@ def delete_user(user_id):
     try:
         db.session.delete(delete_user)
         db.session.commit()
+        invalidate_user_caches(user_id)
         return jsonify({'code': 200, 'msg': '用户删除成功'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'code': 500, 'msg': '删除失败', 'error': str(e)})
 
 # 报修管理API
-@app.route('/api/repairs/<int:order_id>/approve', methods=['PUT'])
-@jwt_required()
+@bp.route('/api/repairs/<int:order_id>/approve', methods=['PUT'])
+@role_required('admin', msg='只有管理员可以访问此功能')
 def approve_repair_order(order_id):
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if user.role != 'admin':
-        return jsonify({'code': 403, 'msg': '只有管理员可以访问此功能'})
-    
-    order = RepairOrder.query.get(order_id)
-    if not order:
-        return jsonify({'code': 404, 'msg': '报修单不存在'})
-    
-    if order.status != 'pending':
-        return jsonify({'code': 400, 'msg': '只有待处理的报修单可以被审核'})
-    
     try:
-        order.status = 'approved'
+        order = transition_order(order_id, 'approve')
+        queue_order_event('approved', order)
         db.session.commit()
         return jsonify({'code': 200, 'msg': '审核通过成功'})
+    except OrderTransitionError as e:
+        db.session.rollback()
+        return jsonify({'code': e.code, 'msg': e.msg})
     except Exception as e:
         db.session.rollback()
         return jsonify({'code': 500, 'msg': '操作失败', 'error': str(e)})
 
-@app.route('/api/repairs/<int:order_id>/reject', methods=['PUT'])
-@jwt_required()
+@bp.route('/api/repairs/<int:order_id>/reject', methods=['PUT'])
+@role_required('admin', msg='只有管理员可以访问此功能')
 def reject_repair_order(order_id):
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if user.role != 'admin':
-        return jsonify({'code': 403, 'msg': '只有管理员可以访问此功能'})
+    try:
+        order = transition_order(order_id, 'reject')
+        queue_order_event('rejected', order)
+        db.session.commit()
+        return jsonify({'code': 200, 'msg': '拒绝成功'})
+    except OrderTransitionError as e:
+        db.session.rollback()
+        return jsonify({'code': e.code, 'msg': e.msg})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'code': 500, 'msg': '操作失败', 'error': str(e)})
+
+# 批量审核/拒绝/派单：一个事务、一条UPDATE完成，逐条返回处理结果
+BATCH_ACTIONS = {
+    'approve': ('approved', '审核通过成功'),
+    'reject': ('rejected', '拒绝成功'),
+    'assign': ('assigned', '派单成功'),
+}
+BATCH_MAX_SIZE = 500
+
+@bp.route('/api/repairs/batch/<action>', methods=['PUT'])
+@role_required('admin', msg='只有管理员可以访问此功能')
+def batch_repair_orders(action):
+    if action not in BATCH_ACTIONS:
+        return jsonify({'code': 404, 'msg': '不支持的批量操作'})
+    event_type, ok_msg = BATCH_ACTIONS[action]
+    
+    data = request.json or {}
+    try:
+        order_ids = list(dict.fromkeys(int(order_id) for order_id in data.get('ids') or []))
+    except (TypeError, ValueError):
+        return jsonify({'code': 400, 'msg': '报修单ID格式错误'})
+    if not order_ids:
+        return jsonify({'code': 400, 'msg': '请选择报修单'})
+    if len(order_ids) > BATCH_MAX_SIZE:
+        return jsonify({'code': 400, 'msg': '单次最多处理%d条报修单' % BATCH_MAX_SIZE})
+    
+    repairman_id = None
+    if action == 'assign':
+        repairman_id = data.get('repairman_id')
+        if isinstance(repairman_id, bool) or not isinstance(repairman_id, int) \
+                or lookup_user_role(repairman_id) != 'repairman':
+            return jsonify({'code': 400, 'msg': '请选择有效的维修人员'})
     
-    order = RepairOrder.query.get(order_id)
-    if not order:
-        return jsonify({'code': 404, 'msg': '报修单不存在'})
+    try:
+        updated_ids = transition_orders(order_ids, action, repairman_id=repairman_id)
+        failed_ids = [order_id for order_id in order_ids if order_id not in updated_ids]
+        parents = dict(db.session.query(RepairOrder.id, RepairOrder.parent_id).filter(
+            RepairOrder.id.in_(failed_ids))) if failed_ids else {}
+        if updated_ids:
+            for order in RepairOrder.query.filter(RepairOrder.id.in_(updated_ids)):
+                queue_order_event(event_type, order)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'code': 500, 'msg': '操作失败', 'error': str(e)})
     
-    if order.status != 'pending':
-        return jsonify({'code': 400, 'msg': '只有待处理的报修单可以被拒绝'})
+    conflict_msg = ORDER_TRANSITIONS[action][2]
+    results = []
+    for order_id in order_ids:
+        if order_id in updated_ids:
+            results.append({'id': order_id, 'code': 200, 'msg': ok_msg})
+        elif order_id in parents:
+            msg = duplicate_conflict_msg(parents[order_id]) if parents[order_id] else conflict_msg
+            results.append({'id': order_id, 'code': 409, 'msg': msg})
+        else:
+            results.append({'id': order_id, 'code': 404, 'msg': '报修单不存在'})
+    
+    return jsonify({'code': 200, 'msg': '批量操作完成', 'data': {
+        'succeeded': len(updated_ids),
+        'failed': len(order_ids) - len(updated_ids),
+        'results': results
+    }})
+
+# 手动合并/取消合并重复报修（管理员）：{"parent_id": 主报修单ID}合并，{"parent_id": null}取消合并。
+# 只有待处理的报修单可以合并，合并后状态和维修人员跟随主报修单；取消合并后保持当前状态单独处理
+@bp.route('/api/repairs/<int:order_id>/parent', methods=['PUT'])
+@role_required('admin', msg='只有管理员可以访问此功能')
+def update_repair_parent(order_id):
+    data = request.json or {}
+    parent_id = data.get('parent_id')
+    if parent_id is not None and (isinstance(parent_id, bool) or not isinstance(parent_id, int)):
+        return jsonify({'code': 400, 'msg': '主报修单ID格式错误'})
     
     try:
-        order.status = 'rejected'
+        order = RepairOrder.query.filter_by(id=order_id).with_for_update().first()
+        if not order:
+            return jsonify({'code': 404, 'msg': '报修单不存在'})
+        if parent_id is None:
+            if order.parent_id is None:
+                return jsonify({'code': 400, 'msg': '该报修单没有合并到其他报修单'})
+            order.parent_id = None
+            queue_order_event('unmerged', order)
+        else:
+            parent = RepairOrder.query.filter_by(id=parent_id).with_for_update().first()
+            if not parent:
+                return jsonify({'code': 404, 'msg': '主报修单不存在'})
+            if parent.id == order.id or parent.parent_id is not None:
+                return jsonify({'code': 400, 'msg': '只能合并到未被合并的主报修单'})
+            if RepairOrder.query.filter_by(parent_id=order.id).first():
+                return jsonify({'code': 400, 'msg': '该报修单下已有合并的报修单，不能再合并到其他报修单'})
+            if order.status != 'pending' or order.parent_id is not None or parent.status not in OPEN_STATUSES:
+                return jsonify({'code': 409, 'msg': '只有待处理的报修单可以合并到未关闭的报修单'})
+            order.parent_id = parent.id
+            order.status = parent.status
+            order.repairman_id = parent.repairman_id
+            queue_order_event('merged', order)
         db.session.commit()
-        return jsonify({'code': 200, 'msg': '拒绝成功'})
+        return jsonify({'code': 200, 'msg': '合并成功' if parent_id else '已取消合并'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'code': 500, 'msg': '操作失败', 'error': str(e)})
 
-@app.route('/api/repairs/pending', methods=['GET'])
-@jwt_required()
+# 自动派单设置（管理员）：维修人员的技能分类和负责楼栋
+@bp.route('/api/dispatch/profiles', methods=['GET'])
+@role_required('admin', msg='只有管理员可以访问此功能')
+def get_dispatch_profiles():
+    repairmen = User.query.filter_by(role='repairman').order_by(User.id).all()
+    skills, areas = {}, {}
+    for skill in RepairmanSkill.query:
+        skills.setdefault(skill.repairman_id, []).append(skill.category_id)
+    for area in RepairmanArea.query:
+        areas.setdefault(area.repairman_id, []).append(area.building)
+    open_tasks = dict(db.session.query(RepairOrder.repairman_id, func.count(RepairOrder.id))
+                      .filter(RepairOrder.status == 'repairing').group_by(RepairOrder.repairman_id))
+    
+    return jsonify({'code': 200, 'msg': '获取成功', 'data': [{
+        'repairman_id': user.id,
+        'name': user.name,
+        'category_ids': sorted(skills.get(user.id, [])),
+        'buildings': sorted(areas.get(user.id, [])),
+        'open_tasks': open_tasks.get(user.id, 0)
+    } for user in repairmen]})
+
+@bp.route('/api/dispatch/profiles/<int:repairman_id>', methods=['PUT'])
+@role_required('admin', msg='只有管理员可以访问此功能')
+def update_dispatch_profile(repairman_id):
+    if lookup_user_role(repairman_id) != 'repairman':
+        return jsonify({'code': 404, 'msg': '维修人员不存在'})
+    data = request.json or {}
+    try:
+        category_ids = {int(category_id) for category_id in data.get('category_ids') or []}
+    except (TypeError, ValueError):
+        return jsonify({'code': 400, 'msg': '故障分类格式错误'})
+    if not category_ids <= set(get_category_map()):
+        return jsonify({'code': 400, 'msg': '故障分类不存在'})
+    buildings = {str(building).strip() for building in data.get('buildings') or [] if str(building).strip()}
+    
+    try:
+        RepairmanSkill.query.filter_by(repairman_id=repairman_id).delete()
+        RepairmanArea.query.filter_by(repairman_id=repairman_id).delete()
+        db.session.add_all([RepairmanSkill(repairman_id=repairman_id, category_id=category_id)
+                            for category_id in category_ids])
+        db.session.add_all([RepairmanArea(repairman_id=repairman_id, building=building) for building in buildings])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'code': 500, 'msg': '保存失败', 'error': str(e)})
+    
+    return jsonify({'code': 200, 'msg': '保存成功'})
+
+# 立即执行一轮自动派单，dry_run为true时只返回派单方案
+@bp.route('/api/dispatch/run', methods=['POST'])
+@role_required('admin', msg='只有管理员可以访问此功能')
+def run_dispatch_now():
+    dry_run = bool((request.json or {}).get('dry_run'))
+    try:
+        result = run_dispatch(dry_run=dry_run)
+    except Exception as e:
+        return jsonify({'code': 500, 'msg': '派单失败', 'error': str(e)})
+    return jsonify({'code': 200, 'msg': '派单方案' if dry_run else '派单完成', 'data': result})
+
+@bp.route('/api/repairs/pending', methods=['GET'])
+@role_required('admin', 'repairman', msg='权限不足')
+@conditional_json('repair_order', 'user', 'category')
 def get_pending_repairs():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    # 合并的重复报修随主报修单审核，不在待处理列表中单独列出
+    query = RepairOrder.query.options(
+        joinedload(RepairOrder.category),
+        joinedload(RepairOrder.student)
+    ).filter_by(status='pending', parent_id=None)
     
-    if user.role != 'admin' and user.role != 'repairman':
-        return jsonify({'code': 403, 'msg': '权限不足'})
+    try:
+        orders, page = paginate_repair_orders(query, request.args)
+    except ValueError as e:
+        return jsonify({'code': 400, 'msg': str(e)})
     
-    orders = RepairOrder.query.filter_by(status='pending').all()
+    counts = duplicate_counts(orders)
     result = []
     for order in orders:
         result.append({
@@ -577,91 +3220,104 @@ def get_pending_repairs():
             'category': order.category.name if order.category else '',
             'status': order.status,
             'created_at': order.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'student_name': order.student.name if order.student else ''
+            'student_name': order.student.name if order.student else '',
+            'duplicate_count': counts.get(order.id, 0)
         })
     
-    return jsonify({'code': 200, 'msg': '获取成功', 'data': result})
+    return jsonify({'code': 200, 'msg': '获取成功', 'data': dict(page, items=result)})
 
 # 维修人员接受任务API
-@app.route('/api/repairs/<int:order_id>/accept', methods=['PUT'])
-@jwt_required()
+@bp.route('/api/repairs/<int:order_id>/accept', methods=['PUT'])
+@role_required('repairman', msg='只有维修人员可以接受任务')
 def accept_repair_task(order_id):
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if user.role != 'repairman':
-        return jsonify({'code': 403, 'msg': '只有维修人员可以接受任务'})
-    
-    order = RepairOrder.query.get(order_id)
-    if not order:
-        return jsonify({'code': 404, 'msg': '报修单不存在'})
-    
-    if order.status != 'approved':
-        return jsonify({'code': 400, 'msg': '只有已审核的报修单可以被接受'})
+    current_user_id = g.user_id
     
     try:
-        order.status = 'repairing'
-        order.repairman_id = current_user_id
+        order = transition_order(order_id, 'accept', repairman_id=current_user_id)
+        queue_order_event('accepted', order)
         db.session.commit()
         return jsonify({'code': 200, 'msg': '任务接受成功'})
+    except OrderTransitionError as e:
+        db.session.rollback()
+        return jsonify({'code': e.code, 'msg': e.msg})
     except Exception as e:
         db.session.rollback()
         return jsonify({'code': 500, 'msg': '操作失败', 'error': str(e)})
 
 # 维修人员更新维修状态API
-@app.route('/api/repairs/<int:order_id>/complete', methods=['PUT'])
-@jwt_required()
+@bp.route('/api/repairs/<int:order_id>/complete', methods=['PUT'])
+@role_required('repairman', msg='只有维修人员可以完成任务')
 def complete_repair_task(order_id):
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if user.role != 'repairman':
-        return jsonify({'code': 403, 'msg': '只有维修人员可以完成任务'})
-    
-    order = RepairOrder.query.get(order_id)
-    if not order:
-        return jsonify({'code': 404, 'msg': '报修单不存在'})
-    
-    if order.status != 'repairing':
-        return jsonify({'code': 400, 'msg': '只有维修中的任务可以被完成'})
-    
-    if order.repairman_id != current_user_id:
-        return jsonify({'code': 403, 'msg': '您不是这个任务的负责人'})
+    current_user_id = g.user_id
     
     try:
-        order.status = 'completed'
-        order.completed_at = datetime.now()
+        order = transition_order(order_id, 'complete', repairman_id=current_user_id)
+        rollup_order_completed(order)
+        queue_order_event('completed', order)
         db.session.commit()
         return jsonify({'code': 200, 'msg': '任务完成成功'})
+    except OrderTransitionError as e:
+        db.session.rollback()
+        return jsonify({'code': e.code, 'msg': e.msg})
     except Exception as e:
         db.session.rollback()
         return jsonify({'code': 500, 'msg': '操作失败', 'error': str(e)})
 
+# 报修单事件推送（Server-Sent Events），EventSource无法设置请求头，令牌可通过?jwt=传递
+SSE_KEEPALIVE_SECONDS = 15
+
+@bp.route('/api/events/stream', methods=['GET'])
+@role_required(locations=['headers', 'query_string'])
+def stream_order_events():
+    user_id, role = g.user_id, g.role
+    subscription = event_broker.subscribe()
+    
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    order_event = subscription.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if event_visible_to(order_event, user_id, role):
+                    yield 'id: %d\nevent: order\ndata: %s\n\n' % (
+                        order_event['id'], json.dumps(order_event, ensure_ascii=False))
+        finally:
+            event_broker.unsubscribe(subscription)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # 关闭nginx缓冲
+    })
+
 # 管理员公告管理API
-@app.route('/api/announcements', methods=['GET'])
+@bp.route('/api/announcements', methods=['GET'])
 @jwt_required()
+@conditional_json('announcement', 'user')
 def get_announcements():
-    announcements = Announcement.query.all()
-    result = []
-    for announcement in announcements:
-        result.append({
-            'id': announcement.id,
-            'title': announcement.title,
-            'content': announcement.content,
-            'created_by': announcement.author.name if announcement.author else '',
-            'created_at': announcement.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'updated_at': announcement.updated_at.strftime('%Y-%m-%d %H:%M:%S')
-        })
+    def load():
+        announcements = Announcement.query.options(joinedload(Announcement.author)).all()
+        result = []
+        for announcement in announcements:
+            result.append({
+                'id': announcement.id,
+                'title': announcement.title,
+                'content': announcement.content,
+                'created_by': announcement.author.name if announcement.author else '',
+                'created_at': announcement.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+                'updated_at': announcement.updated_at.strftime('%Y-%m-%d %H:%M:%S')
+            })
+        return result
+    
+    result = announcement_cache.get_or_load(versioned_cache_key('all', 'announcement', 'user'), load)
     return jsonify({'code': 200, 'msg': '获取成功', 'data': result})
 
-@app.route('/api/announcements', methods=['POST'])
-@jwt_required()
+@bp.route('/api/announcements', methods=['POST'])
+@role_required('admin', msg='只有管理员可以发布公告')
 def create_announcement():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if user.role != 'admin':
-        return jsonify({'code': 403, 'msg': '只有管理员可以发布公告'})
+    current_user_id = g.user_id
     
     data = request.json
     title = data.get('title')
@@ -678,20 +3334,15 @@ def create_announcement():
         )
         db.session.add(announcement)
         db.session.commit()
+        announcement_cache.invalidate()
         return jsonify({'code': 200, 'msg': '公告发布成功', 'data': {'announcement_id': announcement.id}})
     except Exception as e:
         db.session.rollback()
         return jsonify({'code': 500, 'msg': '发布失败', 'error': str(e)})
 
-@app.route('/api/announcements/<int:announcement_id>', methods=['PUT'])
-@jwt_required()
+@bp.route('/api/announcements/<int:announcement_id>', methods=['PUT'])
+@role_required('admin', msg='只有管理员可以编辑公告')
 def update_announcement(announcement_id):
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if user.role != 'admin':
-        return jsonify({'code': 403, 'msg': '只有管理员可以编辑公告'})
-    
     announcement = Announcement.query.get(announcement_id)
     if not announcement:
         return jsonify({'code': 404, 'msg': '公告不存在'})
@@ -705,20 +3356,15 @@ def update_announcement(announcement_id):
             announcement.content = data['content']
         
         db.session.commit()
+        announcement_cache.invalidate()
         return jsonify({'code': 200, 'msg': '公告编辑成功'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'code': 500, 'msg': '编辑失败', 'error': str(e)})
 
-@app.route('/api/announcements/<int:announcement_id>', methods=['DELETE'])
-@jwt_required()
+@bp.route('/api/announcements/<int:announcement_id>', methods=['DELETE'])
+@role_required('admin', msg='只有管理员可以删除公告')
 def delete_announcement(announcement_id):
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if user.role != 'admin':
-        return jsonify({'code': 403, 'msg': '只有管理员可以删除公告'})
-    
     announcement = Announcement.query.get(announcement_id)
     if not announcement:
         return jsonify({'code': 404, 'msg': '公告不存在'})
@@ -726,20 +3372,18 @@ def delete_announcement(announcement_id):
     try:
         db.session.delete(announcement)
         db.session.commit()
+        announcement_cache.invalidate()
         return jsonify({'code': 200, 'msg': '公告删除成功'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'code': 500, 'msg': '删除失败', 'error': str(e)})
 
 # 学生评价维修服务API
-@app.route('/api/comments', methods=['POST'])
-@jwt_required()
+@bp.route('/api/comments', methods=['POST'])
+@role_required('student', msg='只有学生可以评价维修服务')
+@rate_limit('RATELIMIT_WRITE')
 def create_comment():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if user.role != 'student':
-        return jsonify({'code': 403, 'msg': '只有学生可以评价维修服务'})
+    current_user_id = g.user_id
     
     data = request.json
     repair_order_id = data.get('repair_order_id')
@@ -749,7 +3393,7 @@ def create_comment():
     if not all([repair_order_id, rating]):
         return jsonify({'code': 400, 'msg': '请填写完整的评价信息'})
     
-    if rating < 1 or rating > 5:
+    if not isinstance(rating, int) or isinstance(rating, bool) or rating < 1 or rating > 5:
         return jsonify({'code': 400, 'msg': '评分必须在1-5分之间'})
     
     # 检查报修单是否存在且已完成
@@ -776,6 +3420,9 @@ def create_comment():
             content=content
         )
         db.session.add(comment)
+        db.session.flush()
+        rollup_comment(comment, repair_order)
+        queue_order_event('commented', repair_order)
         db.session.commit()
         return jsonify({'code': 200, 'msg': '评价成功'})
     except Exception as e:
@@ -783,10 +3430,11 @@ def create_comment():
         return jsonify({'code': 500, 'msg': '评价失败', 'error': str(e)})
 
 # 获取报修单评价API
-@app.route('/api/comments/<int:repair_order_id>', methods=['GET'])
+@bp.route('/api/comments/<int:repair_order_id>', methods=['GET'])
 @jwt_required()
 def get_comment(repair_order_id):
-    comment = Comment.query.filter_by(repair_order_id=repair_order_id).first()
+    comment = Comment.query.filter_by(repair_order_id=repair_order_id).first() or \
+        ArchivedComment.query.filter_by(repair_order_id=repair_order_id).first()
     if not comment:
         return jsonify({'code': 404, 'msg': '该报修单暂无评价'})
     
@@ -800,6 +3448,270 @@ def get_comment(repair_order_id):
     
     return jsonify({'code': 200, 'msg': '获取成功', 'data': result})
 
+# 故障分类API
+@bp.route('/api/categories', methods=['GET'])
+@jwt_required()
+def get_categories():
+    result = [{'id': category_id, 'name': name} for category_id, name in get_category_map().items()]
+    return jsonify({'code': 200, 'msg': '获取成功', 'data': result})
+
+# 缓存命中统计
+@bp.route('/api/cache/stats', methods=['GET'])
+@role_required('admin', msg='只有管理员可以访问此功能')
+def get_cache_stats():
+    return jsonify({'code': 200, 'msg': '获取成功', 'data': [cache.stats() for cache in CACHES]})
+
+# 数据统计API（读取按天汇总表）
+def stats_start_day(default_days=30):
+    days = min(max(request.args.get('days', default_days, type=int), 1), 366)
+    return days, datetime.now().date() - timedelta(days=days - 1)
+
+@bp.route('/api/stats/trend', methods=['GET'])
+@role_required('admin', msg='只有管理员可以访问此功能')
+def get_stats_trend():
+    days, start_day = stats_start_day(default_days=7)
+    rows = db.session.query(
+        DailyRepairStat.day,
+        func.sum(DailyRepairStat.created_count),
+        func.sum(DailyRepairStat.completed_count)
+    ).filter(DailyRepairStat.day >= start_day).group_by(DailyRepairStat.day).all()
+    by_day = {day: (created or 0, completed or 0) for day, created, completed in rows}
+    
+    dates, created, completed = [], [], []
+    for i in range(days):
+        day = start_day + timedelta(days=i)
+        dates.append(day.strftime('%Y-%m-%d'))
+        created.append(int(by_day.get(day, (0, 0))[0]))
+        completed.append(int(by_day.get(day, (0, 0))[1]))
+    
+    return jsonify({'code': 200, 'msg': '获取成功', 'data': {'dates': dates, 'created': created, 'completed': completed}})
+
+@bp.route('/api/stats/categories', methods=['GET'])
+@role_required('admin', msg='只有管理员可以访问此功能')
+def get_stats_categories():
+    days, start_day = stats_start_day()
+    rows = db.session.query(
+        Category.name,
+        func.sum(DailyRepairStat.created_count)
+    ).join(Category, DailyRepairStat.category_id == Category.id).filter(
+        DailyRepairStat.day >= start_day
+    ).group_by(Category.id, Category.name).all()
+    
+    result = [{'name': name, 'value': int(count or 0)} for name, count in rows if count]
+    return jsonify({'code': 200, 'msg': '获取成功', 'data': result})
+
+@bp.route('/api/stats/buildings', methods=['GET'])
+@role_required('admin', msg='只有管理员可以访问此功能')
+def get_stats_buildings():
+    days, start_day = stats_start_day()
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+    total = func.sum(DailyRepairStat.created_count)
+    rows = db.session.query(DailyRepairStat.building, total).filter(
+        DailyRepairStat.day >= start_day
+    ).group_by(DailyRepairStat.building).order_by(total.desc()).limit(limit).all()
+    
+    result = [{'building': building, 'count': int(count or 0)} for building, count in rows]
+    return jsonify({'code': 200, 'msg': '获取成功', 'data': result})
+
+@bp.route('/api/stats/completion-time', methods=['GET'])
+@role_required('admin', msg='只有管理员可以访问此功能')
+def get_stats_completion_time():
+    days, start_day = stats_start_day()
+    completed, seconds = db.session.query(
+        func.sum(DailyRepairStat.completed_count),
+        func.sum(DailyRepairStat.complete_seconds)
+    ).filter(DailyRepairStat.day >= start_day).one()
+    completed = int(completed or 0)
+    
+    result = {
+        'completed': completed,
+        'avg_hours': round(int(seconds or 0) / completed / 3600, 2) if completed else None
+    }
+    return jsonify({'code': 200, 'msg': '获取成功', 'data': result})
+
+@bp.route('/api/stats/repairmen', methods=['GET'])
+@role_required('admin', msg='只有管理员可以访问此功能')
+def get_stats_repairmen():
+    days, start_day = stats_start_day()
+    rows = db.session.query(
+        User.id,
+        User.name,
+        func.sum(DailyRepairmanStat.completed_count),
+        func.sum(DailyRepairmanStat.complete_seconds),
+        func.sum(DailyRepairmanStat.rating_count),
+        func.sum(DailyRepairmanStat.rating_sum)
+    ).join(User, DailyRepairmanStat.repairman_id == User.id).filter(
+        DailyRepairmanStat.day >= start_day
+    ).group_by(User.id, User.name).all()
+    
+    result = []
+    for repairman_id, name, completed, seconds, rating_count, rating_sum in rows:
+        completed, rating_count = int(completed or 0), int(rating_count or 0)
+        result.append({
+            'repairman_id': repairman_id,
+            'name': name,
+            'completed': completed,
+            'avg_hours': round(int(seconds or 0) / completed / 3600, 2) if completed else None,
+            'rating_count': rating_count,
+            'avg_rating': round(int(rating_sum or 0) / rating_count, 2) if rating_count else None
+        })
+    result.sort(key=lambda r: (r['avg_rating'] or 0, r['completed']), reverse=True)
+    return jsonify({'code': 200, 'msg': '获取成功', 'data': result})
+
+# 评分排行（管理员）：直接读取评分汇总表，按平均分排序，min_count过滤评价次数过少的
+@bp.route('/api/ratings/<scope>', methods=['GET'])
+@role_required('admin', msg='只有管理员可以访问此功能')
+def get_rating_leaderboard(scope):
+    if scope == 'repairmen':
+        names = dict(db.session.query(User.id, User.name).filter_by(role='repairman'))
+        scope = 'repairman'
+    elif scope == 'categories':
+        names = get_category_map()
+        scope = 'category'
+    else:
+        return jsonify({'code': 404, 'msg': '不支持的排行类型'})
+    min_count = max(request.args.get('min_count', 1, type=int), 1)
+    
+    aggregates = RatingAggregate.query.filter(RatingAggregate.scope == scope,
+                                              RatingAggregate.rating_count >= min_count).all()
+    result = [dict(rating_summary(aggregate), id=aggregate.subject_id, name=names.get(aggregate.subject_id, ''))
+              for aggregate in aggregates if aggregate.subject_id in names]
+    result.sort(key=lambda r: (r['avg_rating'], r['rating_count']), reverse=True)
+    return jsonify({'code': 200, 'msg': '获取成功', 'data': result})
+
+# 单个维修人员的评分汇总，管理员可查看所有人，维修人员只能查看自己
+@bp.route('/api/ratings/repairmen/<int:repairman_id>', methods=['GET'])
+@role_required('admin', 'repairman')
+def get_repairman_rating(repairman_id):
+    if g.role == 'repairman' and repairman_id != g.user_id:
+        return jsonify({'code': 403, 'msg': '只能查看自己的评分'})
+    aggregate = RatingAggregate.query.filter_by(scope='repairman', subject_id=repairman_id).first()
+    return jsonify({'code': 200, 'msg': '获取成功', 'data': dict(rating_summary(aggregate), id=repairman_id)})
+
+# 报表导出API：按列查询并使用服务端游标逐批读取，导出全年数据也不会整体载入内存
+REPORT_HEADERS = ['报修单号', '学生姓名', '宿舍信息', '楼栋', '故障类型', '故障描述', '状态', '维修人员', '预约时间', '创建时间', '完成时间']
+STATUS_LABELS = {'pending': '待处理', 'approved': '已审核', 'repairing': '维修中', 'completed': '已完成', 'rejected': '已拒绝'}
+
+def iter_report_rows(args, batch_size=1000):
+    # 热表和归档表分别筛选后合并，按创建时间排序
+    queries = []
+    for model in (RepairOrder, ArchivedRepairOrder):
+        student = aliased(User)
+        repairman = aliased(User)
+        query = db.session.query(
+            model.id, student.name, model.room, Category.name, model.description,
+            model.status, repairman.name, model.appointment_time, model.created_at,
+            model.completed_at
+        ).join(student, model.student_id == student.id).join(
+            Category, model.category_id == Category.id
+        ).outerjoin(repairman, model.repairman_id == repairman.id)
+        queries.append(apply_repair_filters(query, args, model))
+    query = queries[0].union_all(queries[1]).order_by(RepairOrder.created_at, RepairOrder.id)
+    
+    fmt = lambda value: value.strftime('%Y-%m-%d %H:%M:%S') if value else ''
+    for (order_id, student_name, room, category_name, description, status, repairman_name,
+         appointment_time, created_at, completed_at) in query.execution_options(stream_results=True).yield_per(batch_size):
+        yield [order_id, student_name, room, parse_building(room), category_name, description,
+               STATUS_LABELS.get(status, status), repairman_name or '', fmt(appointment_time),
+               fmt(created_at), fmt(completed_at)]
+
+def report_filename(ext, prefix='repairs'):
+    return '%s_%s.%s' % (prefix, datetime.now().strftime('%Y%m%d%H%M%S'), ext)
+
+@bp.route('/api/reports/repairs.csv', methods=['GET'])
+@role_required('admin', msg='只有管理员可以访问此功能', locations=['headers', 'query_string'])
+def export_repairs_csv():
+    try:
+        rows = iter_report_rows(request.args)
+        first_row = next(rows, None)  # 提前执行查询，筛选参数错误时可以直接返回JSON
+    except ValueError as e:
+        return jsonify({'code': 400, 'msg': str(e)})
+    
+    def generate(chunk_size=500):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        buffer.write('\ufeff')  # BOM，Excel打开时正确识别UTF-8
+        writer.writerow(REPORT_HEADERS)
+        if first_row is not None:
+            writer.writerow(first_row)
+        for i, row in enumerate(rows, 1):
+            writer.writerow(row)
+            if i % chunk_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    return Response(stream_with_context(generate()), mimetype='text/csv; charset=utf-8', headers={
+        'Content-Disposition': 'attachment; filename=%s' % report_filename('csv')
+    })
+
+@bp.route('/api/reports/repairs.xlsx', methods=['GET'])
+@role_required('admin', msg='只有管理员可以访问此功能', locations=['headers', 'query_string'])
+def export_repairs_xlsx():
+    from openpyxl import Workbook
+    
+    # write-only模式逐行落盘，xlsx是zip格式必须写完才能发送，因此先写临时文件再分块输出
+    try:
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet('报修单')
+        sheet.append(REPORT_HEADERS)
+        for row in iter_report_rows(request.args):
+            sheet.append(row)
+    except ValueError as e:
+        return jsonify({'code': 400, 'msg': str(e)})
+    
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    size = output.tell()
+    output.seek(0)
+    
+    def generate(chunk_size=64 * 1024):
+        with output:
+            while True:
+                chunk = output.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    
+    return Response(generate(), mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', headers={
+        'Content-Disposition': 'attachment; filename=%s' % report_filename('xlsx'),
+        'Content-Length': str(size)
+    })
+
 # 运行应用
+# 应用工厂：只做配置和注册，不访问数据库，每个worker的启动开销即模块导入开销
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    if config:
+        app.config.update(config)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS',
+                          build_engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config))
+
+    # 创建上传文件夹
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    if app.config['TRUSTED_PROXIES']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'])
+
+    cors.init_app(app)
+    jwt.init_app(app)
+    db.init_app(app)
+    with app.app_context():
+        configure_sqlite_engine(db.engine, app.config['SQLITE_PRAGMAS'])
+    app.register_blueprint(bp)
+    if app.config['DISPATCH_INTERVAL'] > 0:
+        threading.Thread(target=dispatch_loop, args=(app, app.config['DISPATCH_INTERVAL']),
+                         name='dispatch', daemon=True).start()
+    if app.config['ARCHIVE_INTERVAL'] > 0:
+        threading.Thread(target=archive_loop, args=(app, app.config['ARCHIVE_INTERVAL']),
+                         name='archive', daemon=True).start()
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    app = create_app()
+    # 开发环境直接运行时自动建表并写入初始数据；生产环境部署时执行 flask --app app init-db 和 flask --app app seed
+    with app.app_context():
+        init_db()
+        seed_db()
+    app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,68 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import CACHES, Comment, RepairImage, RepairOrder, User, create_app, db, init_db, seed_db  # noqa: E402
+
+
+# 每个测试使用独立的SQLite数据库文件（并发测试需要真实的文件锁，不能用内存库）
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///%s' % (tmp_path / 'test.db'),
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'RATELIMIT_ENABLED': False,
+        'DUPLICATE_DETECTION': False,
+    })
+    for cache in CACHES:
+        cache.invalidate()
+    with app.app_context():
+        init_db()
+        seed_db()
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers(client):
+    """按账号登录，返回带Bearer令牌的请求头"""
+    def login(username, password='123456'):
+        token = client.post('/api/auth/login', json={'username': username, 'password': password}).json['data']['token']
+        return {'Authorization': 'Bearer ' + token}
+    return login
+
+
+ORDER_STATUSES = ('pending', 'approved', 'repairing', 'completed')
+
+
+def add_orders(count):
+    """直接写入count条报修单（状态轮换，每条两张图片，已完成的带评价），需在应用上下文中调用"""
+    student = User.query.filter_by(username='20210001').first()
+    repairman = User.query.filter_by(username='repair001').first()
+    for i in range(count):
+        status = ORDER_STATUSES[i % len(ORDER_STATUSES)]
+        order = RepairOrder(student_id=student.id, repairman_id=repairman.id if status != 'pending' else None,
+                            category_id=1 + i % 2, room='%d号楼%d' % (1 + i % 6, 100 + i % 50),
+                            building='%d号楼' % (1 + i % 6), description='报修%d' % i, status=status)
+        db.session.add(order)
+        db.session.flush()
+        db.session.add_all([RepairImage(repair_order_id=order.id, image_path='%d_%d.jpg' % (order.id, k)) for k in range(2)])
+        if status == 'completed':
+            db.session.add(Comment(repair_order_id=order.id, student_id=student.id, rating=5, content='好'))
+    db.session.commit()
+
+
+@pytest.fixture(name='add_orders')
+def add_orders_fixture():
+    return add_orders
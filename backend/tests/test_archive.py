@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import MetaData, text, update
+
+from app import (ArchivedComment, ArchivedRepairImage, ArchivedRepairOrder, Comment, RepairImage, RepairOrder,
+                 create_app, db, init_db, run_archive)
+
+TABLES = ((RepairOrder, ArchivedRepairOrder), (RepairImage, ArchivedRepairImage), (Comment, ArchivedComment))
+
+
+def close_long_ago():
+    db.session.execute(update(RepairOrder).values(updated_at=datetime.now() - timedelta(days=365)))
+    db.session.commit()
+
+
+def ids(model):
+    return {row_id for row_id, in db.session.query(model.id)}
+
+
+def test_archive_insert_archive_again(app, add_orders):
+    with app.app_context():
+        add_orders(4)  # 第4条（最大id）已完成，带两张图片和一条评价
+        close_long_ago()
+        assert run_archive(days=30)['archived'] == 1
+        assert ids(ArchivedRepairOrder) == {4}
+
+        # 归档删掉了各热表中id最大的行，新写入的行不能复用这些id
+        before = {hot: ids(hot) for hot, _ in TABLES}
+        add_orders(4)
+        for hot, archive in TABLES:
+            assert min(ids(hot) - before[hot]) > max(ids(archive))
+        close_long_ago()
+        assert run_archive(days=30)['archived'] == 1
+        assert ids(ArchivedRepairOrder) == {4, 8}
+        assert len(ids(ArchivedRepairImage)) == 4 and len(ids(ArchivedComment)) == 2
+        for hot, archive in TABLES:
+            assert not ids(hot) & ids(archive)
+
+
+def test_migration_rebuilds_legacy_tables_with_autoincrement(tmp_path):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///%s' % (tmp_path / 'legacy.db')})
+    with app.app_context():
+        # 按旧版本的表结构建库（主键不带AUTOINCREMENT），归档表中已有比热表更大的图片id
+        legacy = MetaData()
+        for table in db.metadata.sorted_tables:
+            table.to_metadata(legacy).dialect_kwargs['sqlite_autoincrement'] = False
+        legacy.create_all(db.engine)
+        with db.engine.begin() as connection:
+            connection.execute(text("INSERT INTO user (id, username, password, name, role) "
+                                    "VALUES (2, '20210001', 'x', '张三', 'student')"))
+            connection.execute(text("INSERT INTO category (id, name) VALUES (1, '水电')"))
+            connection.execute(text("INSERT INTO repair_order (id, student_id, category_id, room, description, "
+                                    "status, created_at) VALUES (1, 2, 1, '1号楼101', '水龙头漏水', 'pending', "
+                                    "'2024-01-01')"))
+            connection.execute(text("INSERT INTO repair_order_archive (id, student_id, category_id, room, description, "
+                                    "status, created_at, archived_at) VALUES (5, 2, 1, '1号楼102', '灯不亮', "
+                                    "'completed', '2024-01-01', '2024-01-01')"))
+            connection.execute(text("INSERT INTO repair_image_archive (id, repair_order_id, image_path) "
+                                    "VALUES (9, 5, 'a.jpg')"))
+        assert 'AUTOINCREMENT' not in db.session.execute(text(
+            "SELECT sql FROM sqlite_master WHERE name = 'repair_image'")).scalar()
+
+        init_db()
+        for hot, _ in TABLES:
+            assert 'AUTOINCREMENT' in db.session.execute(text(
+                "SELECT sql FROM sqlite_master WHERE name = :name"), {'name': hot.__tablename__}).scalar()
+        assert db.session.get(RepairOrder, 1).description == '水龙头漏水'
+
+        order = RepairOrder(student_id=2, category_id=1, room='1号楼103', description='门锁损坏', status='pending')
+        db.session.add(order)
+        db.session.flush()
+        image = RepairImage(repair_order_id=order.id, image_path='b.jpg')
+        db.session.add(image)
+        db.session.commit()
+        assert (order.id, image.id) == (6, 10)
+        # 检索触发器随新表重建
+        assert db.session.execute(text("SELECT rowid FROM repair_order_fts WHERE repair_order_fts MATCH '门锁损'")) \
+            .scalars().all() == [6]
+        db.engine.dispose()
@@ -0,0 +1,52 @@
+import app as app_module
+from app import User, db, hash_password
+
+
+def add_admin(app, username):
+    with app.app_context():
+        user = User(username=username, password=hash_password('123456'), name=username, role='admin')
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def advance_clock(monkeypatch, seconds):
+    now = app_module.time.monotonic()
+    monkeypatch.setattr(app_module.time, 'monotonic', lambda: now + seconds)
+
+
+# 其他worker修改角色时本进程的缓存不会失效，降权最多延迟一个缓存周期（30秒）生效
+def test_role_change_from_another_process_applies_after_cache_ttl(app, client, auth_headers, monkeypatch):
+    user_id = add_admin(app, 'admin2')
+    headers = auth_headers('admin2')
+    assert client.get('/api/users', headers=headers).json['code'] == 200
+
+    with app.app_context():
+        db.session.get(User, user_id).role = 'student'
+        db.session.commit()
+    advance_clock(monkeypatch, 31)
+    assert client.get('/api/users', headers=headers).json['code'] == 403
+
+
+def test_deleted_user_token_is_rejected_after_cache_ttl(app, client, auth_headers, monkeypatch):
+    user_id = add_admin(app, 'admin2')
+    headers = auth_headers('admin2')
+    assert client.get('/api/users', headers=headers).json['code'] == 200
+
+    with app.app_context():
+        db.session.delete(db.session.get(User, user_id))
+        db.session.commit()
+    advance_clock(monkeypatch, 31)
+    assert client.get('/api/users', headers=headers).json['code'] == 401
+
+
+def test_role_change_in_this_process_applies_immediately(app, client, auth_headers):
+    user_id = add_admin(app, 'admin2')
+    headers = auth_headers('admin2')
+    admin_headers = auth_headers('admin')
+    assert client.get('/api/users', headers=headers).json['code'] == 200
+
+    assert client.put('/api/users/%d' % user_id, headers=admin_headers, json={'role': 'student'}).json['code'] == 200
+    assert client.get('/api/users', headers=headers).json['code'] == 403
+    assert client.delete('/api/users/%d' % user_id, headers=admin_headers).json['code'] == 200
+    assert client.get('/api/users', headers=headers).json['code'] == 401
@@ -0,0 +1,60 @@
+import warnings
+
+import pytest
+
+from app import RepairOrder, User, db
+
+
+def create_orders(client, headers, count):
+    return [client.post('/api/repairs', headers=headers, json={
+        'category': 1, 'room': '1号楼%d' % (101 + i), 'description': '报修%d' % i}).json['data']['repair_order_id']
+        for i in range(count)]
+
+
+def results_by_id(response):
+    assert response.json['code'] == 200, response.json
+    return {item['id']: item['code'] for item in response.json['data']['results']}
+
+
+def test_batch_approve_reports_each_id(client, auth_headers):
+    admin = auth_headers('admin')
+    order_ids = create_orders(client, auth_headers('20210001'), 3)
+    assert client.put('/api/repairs/%d/reject' % order_ids[2], headers=admin).json['code'] == 200
+
+    response = client.put('/api/repairs/batch/approve', headers=admin, json={'ids': order_ids + [9999]})
+    assert results_by_id(response) == {order_ids[0]: 200, order_ids[1]: 200, order_ids[2]: 409, 9999: 404}
+    assert response.json['data']['succeeded'] == 2
+    assert response.json['data']['failed'] == 2
+
+
+def test_batch_assign_sets_repairman(app, client, auth_headers):
+    admin = auth_headers('admin')
+    order_ids = create_orders(client, auth_headers('20210001'), 2)
+    client.put('/api/repairs/batch/approve', headers=admin, json={'ids': order_ids[:1]})
+    with app.app_context():
+        repairman_id = User.query.filter_by(username='repair001').first().id
+
+    response = client.put('/api/repairs/batch/assign', headers=admin, json={'ids': order_ids, 'repairman_id': repairman_id})
+    assert results_by_id(response) == {order_ids[0]: 200, order_ids[1]: 409}
+    with app.app_context():
+        order = db.session.get(RepairOrder, order_ids[0])
+        assert (order.status, order.repairman_id) == ('repairing', repairman_id)
+
+
+@pytest.mark.parametrize('repairman_id', [None, '3', 1.5, True, 1])
+def test_batch_assign_requires_a_repairman_id(client, auth_headers, repairman_id):
+    admin = auth_headers('admin')
+    order_ids = create_orders(client, auth_headers('20210001'), 1)
+    data = {'ids': order_ids} if repairman_id is None else {'ids': order_ids, 'repairman_id': repairman_id}
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        response = client.put('/api/repairs/batch/assign', headers=admin, json=data)
+    assert response.json == {'code': 400, 'msg': '请选择有效的维修人员'}
+
+
+def test_batch_rejects_bad_requests(client, auth_headers):
+    admin = auth_headers('admin')
+    assert client.put('/api/repairs/batch/foo', headers=admin, json={'ids': [1]}).json['code'] == 404
+    assert client.put('/api/repairs/batch/approve', headers=admin, json={'ids': []}).json['code'] == 400
+    assert client.put('/api/repairs/batch/approve', headers=admin, json={'ids': ['x']}).json['code'] == 400
+    assert client.put('/api/repairs/batch/approve', headers=auth_headers('20210001'), json={'ids': [1]}).json['code'] == 403
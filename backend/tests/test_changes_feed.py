@@ -0,0 +1,69 @@
+def create_order(client, student, description='水龙头漏水'):
+    return client.post('/api/repairs', headers=student, json={
+        'category': 1, 'room': '1号楼101', 'description': description}).json['data']['repair_order_id']
+
+
+def changes(client, headers, since, limit=None):
+    query = {'since': since} if limit is None else {'since': since, 'limit': limit}
+    response = client.get('/api/repairs/changes', headers=headers, query_string=query).json
+    assert response['code'] == 200
+    return response['data']
+
+
+def test_since_is_required(client, auth_headers):
+    assert client.get('/api/repairs/changes', headers=auth_headers('admin')).json['code'] == 400
+
+
+def test_transition_events_appear_after_previous_cursor(client, auth_headers):
+    student, admin, repairman = auth_headers('20210001'), auth_headers('admin'), auth_headers('repair001')
+    order_id = create_order(client, student)
+    cursor = client.get('/api/repairs', headers=admin).json['data']['changes_cursor']
+    assert changes(client, admin, cursor) == {'events': [], 'orders': [], 'cursor': cursor, 'has_more': False}
+
+    seen = []
+    for action, headers, status in (('approve', admin, 'approved'), ('accept', repairman, 'repairing'),
+                                    ('complete', repairman, 'completed')):
+        assert client.put('/api/repairs/%d/%s' % (order_id, action), headers=headers).json['code'] == 200
+        data = changes(client, admin, cursor)
+        # 每次只返回上次游标之后的新事件，游标单调递增
+        assert len(data['events']) == 1
+        event = data['events'][0]
+        assert event['id'] > cursor and data['cursor'] == event['id']
+        assert (event['order_id'], event['status']) == (order_id, status)
+        assert [(o['id'], o['status']) for o in data['orders']] == [(order_id, status)]
+        seen.append(event['type'])
+        cursor = data['cursor']
+    assert seen == ['approved', 'accepted', 'completed']
+
+    # 学生只收到自己报修单的事件
+    assert [e['type'] for e in changes(client, student, 0)['events']][-3:] == seen
+
+
+def test_limit_pages_through_events_in_order(client, auth_headers):
+    student, admin = auth_headers('20210001'), auth_headers('admin')
+    order_ids = [create_order(client, student, '报修%d' % i) for i in range(5)]
+    for order_id in order_ids:
+        client.put('/api/repairs/%d/approve' % order_id, headers=admin)
+    everything = changes(client, admin, 0)
+    assert not everything['has_more']
+    all_ids = [e['id'] for e in everything['events']]
+    assert all_ids == sorted(all_ids) and len(all_ids) == 10
+
+    cursor, paged = 0, []
+    while True:
+        data = changes(client, admin, cursor, limit=3)
+        assert len(data['events']) <= 3
+        ids = [e['id'] for e in data['events']]
+        assert all(event_id > cursor for event_id in ids)
+        paged += ids
+        assert data['cursor'] == (ids[-1] if ids else cursor)
+        cursor = data['cursor']
+        if not data['has_more']:
+            break
+        assert len(ids) == 3
+    assert paged == all_ids
+    # 已追上最新事件时返回原游标
+    assert changes(client, admin, cursor, limit=3) == {'events': [], 'orders': [], 'cursor': cursor, 'has_more': False}
+    # limit超出范围时按上下限截断
+    assert len(changes(client, admin, 0, limit=0)['events']) == 1
+    assert len(changes(client, admin, 0, limit=10000)['events']) == 10
@@ -0,0 +1,40 @@
+from app import Announcement, User, db
+
+
+# 模拟另一个worker发布公告：只更新数据库（含版本号），不清空本进程的公告缓存
+def add_announcement_elsewhere(app, title):
+    with app.app_context():
+        admin = User.query.filter_by(username='admin').first()
+        db.session.add(Announcement(title=title, content='内容', created_by=admin.id))
+        db.session.commit()
+
+
+def test_announcement_body_matches_etag_after_change_in_another_process(app, client, auth_headers):
+    headers = auth_headers('20210001')
+    first = client.get('/api/announcements', headers=headers)
+    assert first.json['data'] == []
+
+    add_announcement_elsewhere(app, '停水通知')
+    second = client.get('/api/announcements', headers=dict(headers, **{'If-None-Match': first.headers['ETag']}))
+    assert second.status_code == 200
+    assert [a['title'] for a in second.json['data']] == ['停水通知']
+    assert second.headers['ETag'] != first.headers['ETag']
+
+    third = client.get('/api/announcements', headers=dict(headers, **{'If-None-Match': second.headers['ETag']}))
+    assert third.status_code == 304
+
+
+# 列表返回的changes_cursor随评价等事件前进，ETag需要覆盖事件表，否则客户端会因304保留旧游标
+def test_repair_list_etag_changes_with_changes_cursor(app, client, auth_headers):
+    student, admin, repairman = auth_headers('20210001'), auth_headers('admin'), auth_headers('repair001')
+    order_id = client.post('/api/repairs', headers=student,
+                           json={'category': 1, 'room': '1号楼101', 'description': '灯坏了'}).json['data']['repair_order_id']
+    for url, headers in [('approve', admin), ('accept', repairman), ('complete', repairman)]:
+        assert client.put('/api/repairs/%d/%s' % (order_id, url), headers=headers).json['code'] == 200
+    before = client.get('/api/repairs', headers=student)
+
+    assert client.post('/api/comments', headers=student,
+                       json={'repair_order_id': order_id, 'rating': 5, 'content': '很好'}).json['code'] == 200
+    after = client.get('/api/repairs', headers=dict(student, **{'If-None-Match': before.headers['ETag']}))
+    assert after.status_code == 200
+    assert after.json['data']['changes_cursor'] > before.json['data']['changes_cursor']
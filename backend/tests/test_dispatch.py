@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+from app import DispatchOrder, RepairOrder, User, db, hash_password, plan_dispatch
+
+NOW = datetime(2024, 5, 1, 9, 0)
+SLOT = timedelta(minutes=90)
+
+
+def order(order_id, category_id=1, building='1号楼', appointment=None, created_minutes=0):
+    return DispatchOrder(order_id, category_id, building,
+                         NOW + timedelta(hours=appointment) if appointment is not None else None,
+                         NOW + timedelta(minutes=created_minutes))
+
+
+def repairman(load=0, categories=None, buildings=(), appointments=()):
+    return {'categories': categories, 'buildings': set(buildings), 'load': load, 'appointments': list(appointments)}
+
+
+def test_orders_are_planned_by_appointment_then_creation_time():
+    orders = [order(1, created_minutes=0), order(2, appointment=1, created_minutes=5), order(3, created_minutes=-30)]
+    plan = plan_dispatch(orders, {10: repairman()}, max_open_tasks=2, slot=SLOT)
+    # 无预约的按提交时间参与排序：3（-30分钟）、1（0分钟）先于2（预约在1小时后）
+    assert [order_id for order_id, _, _ in plan] == [3, 1]
+
+
+def test_capacity_and_least_loaded_repairman():
+    orders = [order(i, building='%d号楼' % i, created_minutes=i) for i in range(1, 6)]
+    repairmen = {10: repairman(load=2), 11: repairman(load=0), 12: repairman(load=3)}
+    plan = plan_dispatch(orders, repairmen, max_open_tasks=3, slot=SLOT)
+    assigned = {order_id: repairman_id for order_id, repairman_id, _ in plan}
+    # 负载最小的先接单，负载相同时按ID；12号已满不派，10号和11号合计只能再接 (3-2)+(3-0)=4 单
+    assert assigned == {1: 11, 2: 11, 3: 10, 4: 11}
+    assert repairmen[10]['load'] == 2  # 不修改传入的数据
+
+
+def test_prefers_repairman_covering_the_building():
+    repairmen = {10: repairman(load=0), 11: repairman(load=2, buildings={'3号楼'})}
+    plan = plan_dispatch([order(1, building='3号楼'), order(2, building='5号楼', created_minutes=1)], repairmen,
+                         max_open_tasks=5, slot=SLOT)
+    assert plan == [(1, 11, True), (2, 10, False)]
+
+
+def test_respects_skills_and_appointment_slots():
+    repairmen = {10: repairman(categories={1}, appointments=[NOW + timedelta(hours=2)]), 11: repairman(categories={2})}
+    orders = [order(1, category_id=1, appointment=2.5), order(2, category_id=2, appointment=3), order(3, category_id=1, appointment=4)]
+    plan = plan_dispatch(orders, repairmen, max_open_tasks=5, slot=SLOT)
+    # 1号单与10号已有预约只隔30分钟，且11号不会该分类，暂不派单
+    assert plan == [(2, 11, False), (3, 10, False)]
+
+
+def test_dispatch_run_assigns_approved_orders(app, client, auth_headers):
+    student, admin = auth_headers('20210001'), auth_headers('admin')
+    with app.app_context():
+        db.session.add(User(username='r2', password=hash_password('123456'), name='师傅2', role='repairman'))
+        db.session.commit()
+    order_ids = []
+    for i in range(3):
+        order_ids.append(client.post('/api/repairs', headers=student, json={
+            'category': 1, 'room': '%d号楼101' % (i + 1), 'description': '报修%d' % i}).json['data']['repair_order_id'])
+    for order_id in order_ids[:2]:
+        client.put('/api/repairs/%d/approve' % order_id, headers=admin)
+
+    result = client.post('/api/dispatch/run', headers=admin, json={}).json['data']
+    assert (result['considered'], result['assigned']) == (2, 2)
+    with app.app_context():
+        orders = {o.id: o for o in RepairOrder.query.filter(RepairOrder.id.in_(order_ids))}
+        assert [orders[i].status for i in order_ids] == ['repairing', 'repairing', 'pending']
+        assert orders[order_ids[0]].repairman_id != orders[order_ids[1]].repairman_id
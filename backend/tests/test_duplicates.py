@@ -0,0 +1,84 @@
+from app import DailyRepairStat, DailyRepairmanStat, description_shingles, rebuild_daily_stats, shingle_similarity
+
+DESCRIPTION = '卫生间水龙头漏水严重'
+
+
+def similarity(a, b):
+    return shingle_similarity(description_shingles(a), description_shingles(b))
+
+
+def stat_rows():
+    return [sorted(tuple(getattr(row, c.name) for c in model.__table__.columns if c.name != 'id')
+                   for row in model.query) for model in (DailyRepairStat, DailyRepairmanStat)]
+
+
+def create_order(client, student, room, description, category=1):
+    return client.post('/api/repairs', headers=student, json={
+        'category': category, 'room': room, 'description': description}).json
+
+
+def test_shingle_similarity():
+    assert similarity(DESCRIPTION, DESCRIPTION) == 1.0
+    assert similarity('水龙头，漏水！', '水龙头漏水') == 1.0  # 忽略标点和空白
+    assert similarity(DESCRIPTION, '') == 0.0
+    # 默认阈值：同楼栋0.5，同宿舍0.3
+    assert similarity(DESCRIPTION, '卫生间水龙头一直漏水') >= 0.5
+    assert 0.3 <= similarity(DESCRIPTION, '宿舍水龙头漏水了') < 0.5
+    assert 0.3 <= similarity(DESCRIPTION, '水龙头漏水') < 0.5
+    assert similarity(DESCRIPTION, '卫生间灯不亮') < 0.3
+
+
+def test_similar_orders_are_linked_to_parent(app, client, auth_headers):
+    app.config['DUPLICATE_DETECTION'] = True
+    student, admin = auth_headers('20210001'), auth_headers('admin')
+    parent = create_order(client, student, '1号楼101', DESCRIPTION)['data']
+    assert parent['parent_id'] is None
+    parent_id = parent['repair_order_id']
+
+    same_building = create_order(client, student, '1号楼202', '卫生间水龙头一直漏水')
+    assert same_building['data']['parent_id'] == parent_id
+    assert same_building['msg'] == '报修提交成功，已有同楼栋的相同报修（#%d），将一并处理' % parent_id
+    # 同宿舍的阈值更低
+    same_room = create_order(client, student, '1号楼101', '宿舍水龙头漏水了')['data']
+    assert same_room['parent_id'] == parent_id
+    # 不同宿舍相似度未达到0.5、其他楼栋、其他分类都不合并
+    assert create_order(client, student, '1号楼203', '水龙头漏水')['data']['parent_id'] is None
+    assert create_order(client, student, '2号楼101', DESCRIPTION)['data']['parent_id'] is None
+    assert create_order(client, student, '1号楼101', DESCRIPTION, category=2)['data']['parent_id'] is None
+
+    detail = client.get('/api/repairs/%d' % parent_id, headers=admin).json['data']
+    assert detail['duplicate_ids'] == [same_building['data']['repair_order_id'], same_room['repair_order_id']]
+
+
+def test_duplicates_follow_parent_and_are_counted_once(app, client, auth_headers):
+    app.config['DUPLICATE_DETECTION'] = True
+    student, admin, repairman = auth_headers('20210001'), auth_headers('admin'), auth_headers('repair001')
+    parent_id = create_order(client, student, '1号楼101', DESCRIPTION)['data']['repair_order_id']
+    child_id = create_order(client, student, '1号楼202', '卫生间水龙头一直漏水')['data']['repair_order_id']
+
+    for action, headers, status in (('approve', admin, 'approved'), ('accept', repairman, 'repairing'),
+                                    ('complete', repairman, 'completed')):
+        # 重复报修不能单独处理
+        response = client.put('/api/repairs/%d/%s' % (child_id, action), headers=headers).json
+        assert (response['code'], response['msg']) == (409, '该报修单已合并到报修单#%d，请处理主报修单' % parent_id)
+        assert client.put('/api/repairs/%d/%s' % (parent_id, action), headers=headers).json['code'] == 200
+        child = client.get('/api/repairs/%d' % child_id, headers=admin).json['data']
+        assert child['status'] == status
+        if action != 'approve':
+            assert child['repairman_id'] == 3
+    events = client.get('/api/repairs/%d/events' % child_id, headers=admin).json['data']
+    assert [e['type'] for e in events] == ['created', 'approved', 'accepted', 'completed']
+
+    # 一次维修只计一次完成，提交数按两条计
+    def stats():
+        completion = client.get('/api/stats/completion-time', headers=admin).json['data']['completed']
+        repairmen = {r['repairman_id']: r['completed']
+                     for r in client.get('/api/stats/repairmen', headers=admin).json['data']}
+        trend = client.get('/api/stats/trend', headers=admin).json['data']
+        return completion, repairmen, sum(trend['created']), sum(trend['completed'])
+    assert stats() == (1, {3: 1}, 2, 1)
+    # 按明细重建的汇总与增量维护的一致
+    with app.app_context():
+        rows = stat_rows()
+        rebuild_daily_stats()
+        assert stat_rows() == rows
@@ -0,0 +1,60 @@
+import threading
+from collections import Counter
+
+from app import RepairOrder, User, db, hash_password
+
+REPAIRMEN = 20
+ORDERS = 5
+
+
+def add_repairmen(app, count):
+    with app.app_context():
+        password = hash_password('123456')
+        db.session.add_all([User(username='r%d' % i, password=password, name='师傅%d' % i, role='repairman')
+                            for i in range(count)])
+        db.session.commit()
+
+
+# 多名维修人员同时接同一张报修单：条件UPDATE保证只有一人成功，其余返回409
+def test_concurrent_accept_has_exactly_one_winner(app, client, auth_headers):
+    add_repairmen(app, REPAIRMEN)
+    student, admin = auth_headers('20210001'), auth_headers('admin')
+    repairmen = [auth_headers('r%d' % i) for i in range(REPAIRMEN)]
+    order_ids = []
+    for i in range(ORDERS):
+        created = client.post('/api/repairs', headers=student,
+                              json={'category': 1, 'room': '1号楼%d' % (101 + i), 'description': '报修%d' % i}).json
+        order_ids.append(created['data']['repair_order_id'])
+        assert client.put('/api/repairs/%d/approve' % order_ids[-1], headers=admin).json['code'] == 200
+
+    results = Counter()
+    winners = {}
+    lock = threading.Lock()
+
+    def accept(headers, order_id, barrier):
+        worker = app.test_client()
+        barrier.wait()
+        code = worker.put('/api/repairs/%d/accept' % order_id, headers=headers).json['code']
+        with lock:
+            results[(order_id, code)] += 1
+            if code == 200:
+                winners[order_id] = headers
+
+    for order_id in order_ids:
+        barrier = threading.Barrier(REPAIRMEN)
+        threads = [threading.Thread(target=accept, args=(headers, order_id, barrier)) for headers in repairmen]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    for order_id in order_ids:
+        assert results[(order_id, 200)] == 1
+        assert results[(order_id, 409)] == REPAIRMEN - 1
+    with app.app_context():
+        orders = RepairOrder.query.filter(RepairOrder.id.in_(order_ids)).all()
+        assert {o.status for o in orders} == {'repairing'}
+        assert all(o.repairman_id is not None for o in orders)
+
+    # 已被接走的报修单不能再次接单
+    assert client.put('/api/repairs/%d/accept' % order_ids[0], headers=winners[order_ids[0]]).json['code'] == 409
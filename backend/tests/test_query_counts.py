@@ -0,0 +1,42 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app import CACHES, db
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def statement_counts(app, client, headers):
+    urls = ['/api/repairs', '/api/repairs/pending', '/api/repairs/4']
+    counts = {}
+    for role, url in [('admin', url) for url in urls] + [('student', '/api/repairs'), ('repairman', '/api/repairs')]:
+        for cache in CACHES:
+            cache.invalidate()
+        with app.app_context(), count_statements() as statements:
+            response = client.get(url, headers=headers[role])
+        assert response.json['code'] == 200, (role, url, response.json)
+        counts[(role, url)] = len(statements)
+    return counts
+
+
+# 列表和详情接口的查询数应与数据量无关，关联数据通过预加载/批量查询取得，不能按行逐条查询
+def test_repair_order_endpoints_do_not_issue_per_row_queries(app, client, auth_headers, add_orders):
+    headers = {'admin': auth_headers('admin'), 'student': auth_headers('20210001'), 'repairman': auth_headers('repair001')}
+    with app.app_context():
+        add_orders(20)
+    small = statement_counts(app, client, headers)
+    with app.app_context():
+        add_orders(180)
+    large = statement_counts(app, client, headers)
+    assert large == small
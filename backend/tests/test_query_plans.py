@@ -0,0 +1,12 @@
+from app import check_query_plans
+
+
+# 与 flask check-query-plans 相同的检查：热点接口的查询不能出现全表扫描
+def test_hot_queries_use_indexes(app, add_orders):
+    with app.app_context():
+        add_orders(200)
+        results = check_query_plans()
+    assert all(count for _, _, count, _ in results)
+    scans = [(role, url, tables, ' '.join(statement.split()))
+             for role, url, _, order_scans in results for tables, statement in order_scans]
+    assert scans == []
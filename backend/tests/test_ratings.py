@@ -0,0 +1,72 @@
+from app import Comment, RatingAggregate, db, rating_summary, rebuild_rating_aggregates
+
+
+def completed_order(client, student, admin, repairman, category=1):
+    order_id = client.post('/api/repairs', headers=student, json={
+        'category': category, 'room': '1号楼101', 'description': '水龙头漏水'}).json['data']['repair_order_id']
+    assert client.put('/api/repairs/%d/approve' % order_id, headers=admin).json['code'] == 200
+    assert client.put('/api/repairs/%d/accept' % order_id, headers=repairman).json['code'] == 200
+    assert client.put('/api/repairs/%d/complete' % order_id, headers=repairman).json['code'] == 200
+    return order_id
+
+
+def comment(client, student, order_id, rating):
+    response = client.post('/api/comments', headers=student, json={
+        'repair_order_id': order_id, 'rating': rating, 'content': '评价'})
+    assert response.json['code'] == 200
+
+
+def aggregate_rows():
+    return {(a.scope, a.subject_id): rating_summary(a) for a in RatingAggregate.query.all()}
+
+
+def test_rating_aggregates_follow_created_comments(app, client, auth_headers):
+    student, admin, repairman = auth_headers('20210001'), auth_headers('admin'), auth_headers('repair001')
+    for category, rating in ((1, 5), (1, 2), (2, 4)):
+        comment(client, student, completed_order(client, student, admin, repairman, category), rating)
+
+    data = client.get('/api/ratings/repairmen/3', headers=repairman).json['data']
+    assert data['rating_count'] == 3
+    assert data['avg_rating'] == round(11 / 3, 2)
+    assert data['histogram'] == {'1': 0, '2': 1, '3': 0, '4': 1, '5': 1}
+    assert data['recent_count'] == 3
+
+    categories = {row['id']: row for row in client.get('/api/ratings/categories', headers=admin).json['data']}
+    assert (categories[1]['rating_count'], categories[1]['avg_rating']) == (2, 3.5)
+    assert (categories[2]['rating_count'], categories[2]['avg_rating']) == (1, 4.0)
+
+    # 增量维护的结果与按明细重建的一致
+    with app.app_context():
+        incremental = aggregate_rows()
+        rebuild_rating_aggregates()
+        assert aggregate_rows() == incremental
+
+
+def test_rating_aggregates_after_comments_are_deleted(app, client, auth_headers):
+    student, admin, repairman = auth_headers('20210001'), auth_headers('admin'), auth_headers('repair001')
+    order_ids = [completed_order(client, student, admin, repairman) for _ in range(3)]
+    for order_id, rating in zip(order_ids, (5, 1, 3)):
+        comment(client, student, order_id, rating)
+
+    # 没有删除评价的接口，删除只能直接改库，之后用rebuild-ratings修复汇总表
+    with app.app_context():
+        Comment.query.filter(Comment.repair_order_id.in_(order_ids[:2])).delete(synchronize_session=False)
+        db.session.commit()
+        rebuild_rating_aggregates()
+    data = client.get('/api/ratings/repairmen/3', headers=repairman).json['data']
+    assert (data['rating_count'], data['avg_rating']) == (1, 3.0)
+    assert data['histogram'] == {'1': 0, '2': 0, '3': 1, '4': 0, '5': 0}
+    assert (data['recent_count'], data['recent_avg_rating']) == (1, 3.0)
+
+    # 全部删除后汇总行被清空，再评价时从零开始累加
+    with app.app_context():
+        Comment.query.delete()
+        db.session.commit()
+        rebuild_rating_aggregates()
+        assert RatingAggregate.query.count() == 0
+    assert client.get('/api/ratings/repairmen/3', headers=repairman).json['data']['rating_count'] == 0
+    assert client.get('/api/ratings/categories', headers=admin).json['data'] == []
+
+    comment(client, student, order_ids[0], 4)
+    data = client.get('/api/ratings/repairmen/3', headers=repairman).json['data']
+    assert (data['rating_count'], data['avg_rating'], data['recent_avg_rating']) == (1, 4.0, 4.0)
@@ -0,0 +1,32 @@
+import io
+
+import pytest
+from PIL import Image
+
+
+def upload_image(client, headers):
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), 'red').save(buffer, 'JPEG')
+    buffer.seek(0)
+    response = client.post('/api/uploads/images', headers=headers, data={'file': (buffer, 'a.jpg')},
+                           content_type='multipart/form-data')
+    return response.json['data']['path']
+
+
+def create_order(client, headers, **fields):
+    data = dict({'category': 1, 'room': '1号楼101', 'description': '灯坏了'}, **fields)
+    return client.post('/api/repairs', headers=headers, json=data).json
+
+
+def test_create_order_with_uploaded_image(client, auth_headers):
+    student = auth_headers('20210001')
+    path = upload_image(client, student)
+    created = create_order(client, student, images=[path])
+    assert created['code'] == 200
+    detail = client.get('/api/repairs/%d' % created['data']['repair_order_id'], headers=student).json
+    assert len(detail['data']['images']) == 1
+
+
+@pytest.mark.parametrize('images', [[1], [{}], [None], 'abc.jpg', {'path': 'a.jpg'}, None, ['../app.py']])
+def test_create_order_rejects_invalid_images(client, auth_headers, images):
+    assert create_order(client, auth_headers('20210001'), images=images) == {'code': 400, 'msg': '图片无效，请重新上传'}
@@ -0,0 +1,46 @@
+import pytest
+
+
+@pytest.fixture
+def orders(client, auth_headers):
+    student = auth_headers('20210001')
+    for room, description in [('3号楼301', '卫生间水龙头漏水'), ('3号楼302', '空调不制冷'),
+                              ('5号楼101', '水龙头坏了，一直滴水'), ('5号楼102', '门锁<坏>了')]:
+        assert client.post('/api/repairs', headers=student,
+                           json={'category': 1, 'room': room, 'description': description}).json['code'] == 200
+
+
+def search(client, headers, q):
+    response = client.get('/api/repairs/search', headers=headers, query_string={'q': q})
+    assert response.json['code'] == 200, response.json
+    return response.json['data']['items']
+
+
+def test_trigram_match_requires_every_term_and_highlights(client, auth_headers, orders):
+    items = search(client, auth_headers('admin'), '水龙头 漏水')
+    assert [item['room'] for item in items] == ['3号楼301']
+    assert items[0]['highlight']['description'] == '卫生间<mark>水龙头</mark><mark>漏水</mark>'
+
+    assert sorted(item['room'] for item in search(client, auth_headers('admin'), '水龙头')) == ['3号楼301', '5号楼101']
+
+
+def test_short_terms_fall_back_to_like(client, auth_headers, orders):
+    admin = auth_headers('admin')
+    assert sorted(item['room'] for item in search(client, admin, '滴水')) == ['5号楼101']
+    assert sorted(item['room'] for item in search(client, admin, '3号')) == ['3号楼301', '3号楼302']
+    # 短词与长词组合：长词走索引，短词在索引表上过滤
+    items = search(client, admin, '水龙头 5号')
+    assert [item['room'] for item in items] == ['5号楼101']
+    assert items[0]['highlight']['room'] == '<mark>5号</mark>楼101'
+
+
+def test_search_matches_student_name_and_escapes_html(client, auth_headers, orders):
+    admin = auth_headers('admin')
+    assert len(search(client, admin, '张三')) == 4
+    items = search(client, admin, '<坏>')
+    assert [item['room'] for item in items] == ['5号楼102']
+    assert items[0]['highlight']['description'] == '门锁<mark>&lt;坏&gt;</mark>了'
+
+
+def test_search_requires_terms(client, auth_headers):
+    assert client.get('/api/repairs/search', headers=auth_headers('admin'), query_string={'q': ' '}).json['code'] == 400
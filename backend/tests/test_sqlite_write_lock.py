@@ -0,0 +1,64 @@
+import threading
+import time
+
+import pytest
+
+import app as app_module
+from app import User, db
+
+HASH_SECONDS = 1.5
+
+
+@pytest.fixture
+def slow_hash(app, monkeypatch):
+    """哈希计算耗时HASH_SECONDS，busy_timeout缩短到300毫秒：计算期间若持有写锁，其他写请求会失败"""
+    monkeypatch.setitem(app.config['SQLITE_PRAGMAS'], 'busy_timeout', 300)
+    with app.app_context():
+        db.engine.dispose()
+    started = threading.Event()
+    generate_password_hash = app_module.generate_password_hash
+
+    def slow_generate_password_hash(*args, **kwargs):
+        started.set()
+        time.sleep(HASH_SECONDS)
+        return generate_password_hash(*args, **kwargs)
+    monkeypatch.setattr(app_module, 'generate_password_hash', slow_generate_password_hash)
+    return started
+
+
+def run_alongside_hash(app, started, method, url, headers, json):
+    result = {}
+
+    def request():
+        result['response'] = app.test_client().open(url, method=method, headers=headers, json=json)
+    thread = threading.Thread(target=request)
+    thread.start()
+    assert started.wait(5)
+    return thread, result
+
+
+@pytest.mark.parametrize('method,url,json', [
+    ('POST', '/api/users', {'username': 'u1', 'password': 'pw', 'name': '新用户', 'role': 'student'}),
+    ('PUT', '/api/users/2', {'password': 'pw'}),
+])
+def test_user_management_does_not_hold_write_lock_while_hashing(app, client, auth_headers, slow_hash, method, url, json):
+    admin, student = auth_headers('admin'), auth_headers('20210001')
+    thread, result = run_alongside_hash(app, slow_hash, method, url, admin, json)
+
+    created = client.post('/api/repairs', headers=student, json={'category': 1, 'room': '1号楼101', 'description': '灯坏了'})
+    thread.join()
+    assert created.json['code'] == 200
+    assert result['response'].json['code'] == 200
+
+
+def test_change_password_does_not_hold_write_lock_while_hashing(app, client, auth_headers, slow_hash):
+    admin, student = auth_headers('admin'), auth_headers('20210001')
+    thread, result = run_alongside_hash(app, slow_hash, 'POST', '/api/auth/change-password', admin,
+                                        {'current_password': '123456', 'new_password': 'new-pw'})
+
+    created = client.post('/api/repairs', headers=student, json={'category': 1, 'room': '1号楼101', 'description': '灯坏了'})
+    thread.join()
+    assert created.json['code'] == 200
+    assert result['response'].json['code'] == 200
+    with app.app_context():
+        assert app_module.check_password_hash(User.query.filter_by(username='admin').first().password, 'new-pw')
@@ -0,0 +1,58 @@
+import csv
+import io
+
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+import app as app_module
+from app import User, db
+
+
+def import_csv(client, headers, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['账号', '密码', '姓名', '角色'])
+    writer.writerows(rows)
+    data = {'file': (io.BytesIO(buffer.getvalue().encode('utf-8')), 'users.csv')}
+    response = client.post('/api/users/import', headers=headers, data=data, content_type='multipart/form-data')
+    return {row[0]: row for row in csv.reader(io.StringIO(response.get_data(as_text=True).lstrip('﻿')))}
+
+
+class InlineHashPool:
+    """在当前进程中计算哈希；before_hash在计算前执行，模拟哈希期间的并发请求"""
+    def __init__(self, before_hash):
+        self.before_hash = before_hash
+
+    def map(self, fn, items, chunksize=1):
+        self.before_hash()
+        return [fn(item) for item in items]
+
+
+def test_import_reports_each_row(app, client, auth_headers, monkeypatch):
+    monkeypatch.setattr(app_module, 'get_hash_pool', lambda: InlineHashPool(lambda: None))
+    results = import_csv(client, auth_headers('admin'), [
+        ['s1', 'pw', '学生一', '学生'],
+        ['s2', 'pw', '学生二', 'student'],
+        ['s1', 'pw', '重复', '学生'],
+        ['admin', 'pw', '管理员', 'admin'],
+        ['s3', 'pw', '学生三', '校长'],
+    ])
+    assert [results[str(n)][2:] for n in range(2, 7)] == [
+        ['成功', '导入成功'], ['成功', '导入成功'], ['失败', '文件中用户名重复'],
+        ['失败', '用户名已存在'], ['失败', '角色无效']]
+    with app.app_context():
+        assert User.query.filter_by(username='s2').first().role == 'student'
+
+
+# 计算哈希期间不持有写锁：其他连接可以写入；写入的同名用户按唯一约束冲突处理，其余行照常导入
+def test_import_does_not_hold_write_lock_while_hashing(app, client, auth_headers, monkeypatch):
+    def create_conflicting_user():
+        with db.engine.begin() as connection:
+            connection.execute(insert(User), [{'username': 's2', 'name': '抢先创建', 'role': 'student',
+                                               'password': generate_password_hash('x', method='pbkdf2:sha256:1000')}])
+    monkeypatch.setattr(app_module, 'get_hash_pool', lambda: InlineHashPool(create_conflicting_user))
+    results = import_csv(client, auth_headers('admin'), [['s1', 'pw', '学生一', '学生'], ['s2', 'pw', '学生二', '学生']])
+    assert results['2'][2:] == ['成功', '导入成功']
+    assert results['3'][2:] == ['失败', '用户名已存在']
+    with app.app_context():
+        assert User.query.filter_by(username='s2').first().name == '抢先创建'